@@ -18,14 +18,14 @@ HOSTNAME = config.get('settings', 'hostname')
 class APIClient:
     register_url = 'http://%s/api/accounts/register/'
     likes_url = 'http://%s/api/posts/likes/'
-    post_create_url = 'http://%s/api/posts/create/'
+    post_bulk_create_url = 'http://%s/api/posts/bulk-create/'
     activate_url = 'http://%s/activate/{key}/{user_id}/'
     jwt_token_url = 'http://%s/api-token-auth/'
 
     def __init__(self, hostname):
         self.register_url = self.register_url % hostname
         self.likes_url = self.likes_url % hostname
-        self.post_create_url = self.post_create_url % hostname
+        self.post_bulk_create_url = self.post_bulk_create_url % hostname
         self.activate_url = self.activate_url % hostname
         self.jwt_token_url = self.jwt_token_url % hostname
 
@@ -65,10 +65,14 @@ class APIClient:
         if response.status_code == 200:
             return 'Account is active' in response.text
 
-    def create_post_by_user(self, email, password, post_data):
+    def create_posts_by_user(self, email, password, posts_data):
         jwt_token = self.get_jwt_token(email, password)
-        response = self.post_data(self.post_create_url, post_data, jwt_token=jwt_token)
-        return response.json().get('id')
+        try:
+            response = requests.post(self.post_bulk_create_url, json=posts_data,
+                                     headers={'Authorization': 'JWT ' + jwt_token})
+        except requests.exceptions.ConnectionError as error:
+            return []
+        return [post_id for post_id in response.json().get('ids', []) if post_id]
 
     def like_post(self, user_id, post_id, email, password):
         jwt_token = self.get_jwt_token(email, password)
@@ -102,11 +106,10 @@ def run(number_of_users, max_posts_per_user, max_likes_per_user, max_try, hostna
         i += 1
         if email:
             number_of_posts = random.randint(1, max_posts_per_user)
-            for _ in range(number_of_posts):
-                post_id = client.create_post_by_user(email, '1q2w3e', {'title': faker.text(15),
-                                                                       'content': faker.text(),
-                                                                       'is_published': True})
-                post_ids.append(post_id)
+            post_ids.extend(client.create_posts_by_user(email, '1q2w3e', [{'title': faker.text(15),
+                                                                          'content': faker.text(),
+                                                                          'is_published': True}
+                                                                         for _ in range(number_of_posts)]))
             users.append((email, user_id))
     for email, user_id in users:
         number_of_likes = random.randint(1, max_likes_per_user)
@@ -0,0 +1,64 @@
+"""
+Deferred additional info of users (ACCOUNTS_ENRICHMENT_MODE = 'deferred').
+Users are registered without waiting for clearbit.com, the users with
+enriched_at = NULL get their blank bio, location and site filled later in batches.
+"""
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import User
+from .providers import ProviderUnavailable
+from .utils import ClearbitLookupQueued, get_additional_info
+
+BackfillResult = namedtuple('BackfillResult', ['checked', 'enriched', 'duration'])
+
+
+def is_deferred():
+    return settings.ACCOUNTS_ENRICHMENT_MODE == 'deferred'
+
+
+def backfill_additional_info(batch_size=100, limit=None):
+    """
+    Look up the additional info of the users not enriched yet, oldest first,
+    and save every batch in one transaction. Stops when clearbit.com is
+    unavailable, the rest is left to the next run, as are the users whose
+    lookup is queued by clearbit.com.
+    """
+    started = time.time()
+    queryset = User.objects.filter(enriched_at__isnull=True).exclude(
+        provisioning_status=User.PROVISIONING_FAILED).order_by('pk').only('email', *User.ADDITIONAL_INFO_FIELDS)
+    checked = enriched = 0
+    last_id = 0
+    while limit is None or checked < limit:
+        size = batch_size if limit is None else min(batch_size, limit - checked)
+        users = list(queryset.filter(pk__gt=last_id)[:size])
+        if not users:
+            break
+        updates = []
+        queued = 0
+        available = True
+        for user in users:
+            try:
+                data = get_additional_info(user.email)
+            except ClearbitLookupQueued:
+                queued += 1
+                continue
+            except ProviderUnavailable:
+                available = False
+                break
+            updates.append((user, user.set_additional_info(data or {})))
+        now = timezone.now()
+        with transaction.atomic():
+            for user, changed in updates:
+                fields = {name: getattr(user, name) for name in changed}
+                User.objects.filter(pk=user.pk, enriched_at__isnull=True).update(enriched_at=now, **fields)
+        checked += len(updates) + queued
+        enriched += sum(1 for _, changed in updates if changed)
+        if not available:
+            break
+        last_id = users[-1].pk
+    return BackfillResult(checked, enriched, time.time() - started)
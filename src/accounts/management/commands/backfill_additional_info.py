@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from accounts.enrichment import backfill_additional_info
+
+
+class Command(BaseCommand):
+    help = 'Fill bio, location and site of the users registered without the clearbit.com lookup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of users saved in one transaction')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Max number of users to check')
+
+    def handle(self, *args, **options):
+        result = backfill_additional_info(batch_size=options['batch_size'], limit=options['limit'])
+        self.stdout.write('Checked %d users, enriched %d in %.2fs' % result)
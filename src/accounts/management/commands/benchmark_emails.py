@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Compare sending emails one by one with send_mail() (a connection per email)
+    against sending them over one connection, as the email queue does.
+    Use a local backend, e.g. DJANGO_EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend,
+    or a local SMTP server: python -m smtpd -n -c DebuggingServer localhost:1025
+    with DJANGO_EMAIL_HOST=localhost DJANGO_EMAIL_PORT=1025 DJANGO_EMAIL_HOST_USER= DJANGO_EMAIL_HOST_PASSWORD=
+    """
+    help = 'Benchmark the email throughput of EMAIL_BACKEND'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100, help='Number of emails')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        recipients = ['benchmark%d@example.com' % i for i in range(count)]
+
+        start = time.time()
+        for recipient in recipients:
+            send_mail('benchmark', 'benchmark email', settings.ADMIN_EMAIL, [recipient], fail_silently=False)
+        single = time.time() - start
+
+        start = time.time()
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        try:
+            for recipient in recipients:
+                connection.send_messages([EmailMessage('benchmark', 'benchmark email', settings.ADMIN_EMAIL,
+                                                       [recipient])])
+        finally:
+            connection.close()
+        batched = time.time() - start
+
+        self.stdout.write('%s, %d emails' % (settings.EMAIL_BACKEND, count))
+        self.stdout.write('send_mail: %.1f emails/s' % (count / single))
+        self.stdout.write('one connection: %.1f emails/s' % (count / batched))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from accounts.utils import get_hunter_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hits and misses of the hunter.io results cache'
+
+    def handle(self, *args, **options):
+        stats = get_hunter_stats()
+        hits = stats['local_hits'] + stats['shared_hits']
+        total = hits + stats['misses']
+        ratio = hits * 100.0 / total if total else 0
+        average_ms = stats['upstream_ms'] * 1.0 / stats['misses'] if stats['misses'] else 0
+        self.stdout.write('%d local hits, %d shared hits, %d misses (%.1f%% hits)' % (
+            stats['local_hits'], stats['shared_hits'], stats['misses'], ratio))
+        self.stdout.write('hunter.io %.0fms per request, about %.1fs saved' % (
+            average_ms, hits * average_ms / 1000))
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 20:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_enriched(apps, schema_editor):
+    # the existing users got the additional info in the registration
+    User = apps.get_model('accounts', 'User')
+    User.objects.update(enriched_at=F('date_joined'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_user_provisioning_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='enriched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_enriched, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
+from django.core import signing
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.core.mail import send_mail
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.contrib.auth.models import (
     AbstractBaseUser, PermissionsMixin
@@ -7,6 +8,8 @@ from django.contrib.auth.models import (
 from django.urls import reverse
 from django.conf import settings
 
+from simple_api.mail_queue import send_email
+
 from .managers import UserManager
 
 
@@ -16,6 +19,19 @@ class User(AbstractBaseUser, PermissionsMixin):
     admin-compliant permissions.
 
     """
+    PROVISIONING_PENDING = 'pending'
+    PROVISIONING_READY = 'ready'
+    PROVISIONING_FAILED = 'failed'
+    PROVISIONING_STATUSES = (
+        (PROVISIONING_PENDING, 'Pending'),
+        (PROVISIONING_READY, 'Ready'),
+        (PROVISIONING_FAILED, 'Failed'),
+    )
+    # salt of the signed user ids of the provisioning status urls
+    STATUS_TOKEN_SALT = 'accounts.provisioning-status'
+    # fields filled with the additional info from clearbit.com
+    ADDITIONAL_INFO_FIELDS = ('bio', 'location', 'site')
+
     email = models.EmailField(max_length=40, unique=True)
     phone = models.CharField(max_length=15, blank=True)
     first_name = models.CharField(max_length=30)
@@ -26,6 +42,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
+    # 'pending' while the asynchronous registration tasks are running
+    provisioning_status = models.CharField(max_length=10, choices=PROVISIONING_STATUSES,
+                                           default=PROVISIONING_READY)
+    # when the additional info was looked up, NULL - to be backfilled
+    enriched_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()
 
@@ -50,10 +71,34 @@ class User(AbstractBaseUser, PermissionsMixin):
         self.save()
         return self.is_active
 
+    def set_additional_info(self, data):
+        """
+        Fill the blank additional info fields with the valid values of data,
+        return the names of the changed fields
+        """
+        changed = []
+        for name in self.ADDITIONAL_INFO_FIELDS:
+            value = data.get(name)
+            if not value or getattr(self, name):
+                continue
+            try:
+                value = self._meta.get_field(name).clean(value, self)
+            except ValidationError:
+                continue
+            setattr(self, name, value)
+            changed.append(name)
+        return changed
+
     def generate_activation_key(self):
         token_generator = PasswordResetTokenGenerator()
         return token_generator.make_token(self)
 
+    def generate_status_token(self):
+        """
+        Token of the provisioning status url, the signed id of the user
+        """
+        return signing.dumps(self.pk, salt=self.STATUS_TOKEN_SALT)
+
     def send_activation_email(self):
         activation_key = self.generate_activation_key()
         url = reverse('activation_link', kwargs={
@@ -61,7 +106,7 @@ class User(AbstractBaseUser, PermissionsMixin):
             'pk': self.id
         })
         activation_link = '%s://%s%s' % (settings.PROTOCOL, settings.HOSTNAME, url)
-        send_mail('email verified', activation_link, settings.ADMIN_EMAIL, [self.email], fail_silently=False)
+        send_email('email verified', activation_link, settings.ADMIN_EMAIL, [self.email])
 
     def __str__(self):
         return self.email
@@ -0,0 +1,120 @@
+"""
+HTTP client of the external providers (hunter.io, clearbit.com).
+A provider has one requests.Session per process, so the connections are kept alive
+and reused, every request has connect and read timeouts and is retried with
+a backoff on connection errors and 5xx responses. After a number of failures in
+a row the circuit breaker of the provider opens and the requests fail fast with
+ProviderUnavailable, which the callers treat as an unknown result.
+"""
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class ProviderUnavailable(requests.RequestException):
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Opened after failure_threshold failures in a row, lets one trial request
+    through every reset_timeout seconds while open and is closed by a success
+    """
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # half-open, the next trial is allowed after another reset_timeout
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+class ProviderClient(object):
+
+    def __init__(self, name, connect_timeout=None, read_timeout=None, retries=None, backoff_factor=None,
+                 pool_size=None, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.PROVIDER_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else settings.PROVIDER_READ_TIMEOUT,
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold if failure_threshold is not None else settings.PROVIDER_CIRCUIT_FAILURES,
+            reset_timeout if reset_timeout is not None else settings.PROVIDER_CIRCUIT_RESET_TIMEOUT,
+        )
+        retries = retries if retries is not None else settings.PROVIDER_RETRIES
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor if backoff_factor is not None else settings.PROVIDER_RETRY_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        pool_size = pool_size or settings.PROVIDER_POOL_SIZE
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, **kwargs):
+        """
+        requests.get() through the session, raises ProviderUnavailable when the request
+        fails after the retries, the response is 5xx or the circuit breaker is open
+        """
+        if not self.breaker.allow_request():
+            raise ProviderUnavailable('%s is unavailable' % self.name)
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.RequestException as error:
+            self.breaker.record_failure()
+            raise ProviderUnavailable('%s request failed: %r' % (self.name, error))
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise ProviderUnavailable('%s responded %d' % (self.name, response.status_code))
+        self.breaker.record_success()
+        return response
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_provider_client(name, **options):
+    """
+    Shared ProviderClient of the provider in this process,
+    the options are the ProviderClient arguments of its first use
+    """
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = ProviderClient(name, **options)
+        return _clients[name]
@@ -1,9 +1,11 @@
 from rest_framework import serializers
+
+from simple_api.sparse_fieldsets import SparseFieldsetMixin
 from .models import User
 from .utils import get_hunter_client
 
 
-class UserDetailSerializer(serializers.ModelSerializer):
+class UserDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = [
@@ -21,6 +23,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     password1 = serializers.CharField(write_only=True)
     activation_key = serializers.SerializerMethodField(read_only=True)
+    status_token = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = User
@@ -35,9 +38,13 @@ class UserCreateSerializer(serializers.ModelSerializer):
             'location',
             'bio',
             'site',
-            'activation_key'
+            'activation_key',
+            'provisioning_status',
+            'status_token'
         ]
         extra_kwargs = {"id":
+                            {"read_only": True},
+                        "provisioning_status":
                             {"read_only": True}
                         }
 
@@ -45,6 +52,10 @@ class UserCreateSerializer(serializers.ModelSerializer):
         if obj.id:
             return obj.generate_activation_key()
 
+    def get_status_token(self, obj):
+        if obj.id:
+            return obj.generate_status_token()
+
     def validate_password1(self, value):
         data = self.get_initial()
         password = data.get("password")
@@ -54,6 +65,9 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return value
 
     def validate_email(self, value):
+        # the asynchronous registration verifies the email in accounts.tasks
+        if not self.context.get('verify_email', True):
+            return value
         hunter = get_hunter_client()
         status = hunter.email_verifier(value)
         if status == 'undeliverable':
@@ -67,6 +81,16 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return user_inst
 
 
+class UserProvisioningStatusSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = [
+            'id',
+            'provisioning_status',
+        ]
+
+
 class UserListSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -1,6 +1,144 @@
-from celery import shared_task
+import logging
+from smtplib import SMTPException
+
+from celery import Task, chain, shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from redis.exceptions import LockError
+
+from simple_api import mail_queue
+
+from . import enrichment
+from .providers import ProviderUnavailable
+from .utils import ClearbitLookupQueued, get_additional_info, get_hunter_client
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+class ProvisioningTask(Task):
+    """
+    Registration task, the user of the first argument is marked as failed
+    when the task fails after all the retries
+    """
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        user_id = args[0] if args else kwargs.get('user_id')
+        User.objects.filter(pk=user_id, provisioning_status=User.PROVISIONING_PENDING) \
+            .update(provisioning_status=User.PROVISIONING_FAILED)
+        logger.error('Provisioning of the user %s failed: %r', user_id, exc)
+
+
+def get_pending_user(user_id):
+    """
+    Return the user still being provisioned, None if it is deleted or failed
+    """
+    return User.objects.filter(pk=user_id, provisioning_status=User.PROVISIONING_PENDING).first()
+
+
+@shared_task(base=ProvisioningTask, bind=True, max_retries=5)
+def verify_user_email(self, user_id):
+    """
+    Check the email with hunter.io, an undeliverable email fails the registration.
+    The check is retried while hunter.io is unavailable, then the email is accepted
+    as the synchronous registration does.
+    """
+    user = get_pending_user(user_id)
+    if user is None:
+        return None
+    result = get_hunter_client().email_verifier(user.email)
+    if result is None and self.request.retries < self.max_retries:
+        raise self.retry(countdown=2 ** self.request.retries)
+    if result == 'undeliverable':
+        User.objects.filter(pk=user_id).update(provisioning_status=User.PROVISIONING_FAILED)
+    return result
+
+
+@shared_task(base=ProvisioningTask, bind=True, max_retries=3)
+def enrich_user(self, user_id):
+    """
+    Fill the blank bio, location and site of the user from clearbit.com,
+    the user is provisioned without them when clearbit.com stays unavailable
+    or queues the lookup and they are left to the backfill_additional_info task
+    """
+    user = get_pending_user(user_id)
+    if user is None:
+        return []
+    try:
+        additional_data = get_additional_info(user.email)
+    except ProviderUnavailable as error:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=error, countdown=2 ** self.request.retries)
+        logger.warning('Skipped the additional info of the user %s: %r', user_id, error)
+        return []
+    except ClearbitLookupQueued:
+        return []
+    changed = user.set_additional_info(additional_data or {})
+    user.enriched_at = timezone.now()
+    user.save(update_fields=changed + ['enriched_at'])
+    return changed
+
+
+@shared_task(base=ProvisioningTask, bind=True, autoretry_for=(SMTPException, OSError),
+             retry_backoff=True, max_retries=5)
+def send_activation_email(self, user_id):
+    """
+    Send the activation email and finish the provisioning of the user
+    """
+    user = get_pending_user(user_id)
+    if user is None:
+        return False
+    user.send_activation_email()
+    User.objects.filter(pk=user_id, provisioning_status=User.PROVISIONING_PENDING) \
+        .update(provisioning_status=User.PROVISIONING_READY)
+    return True
+
+
+def provision_user(user_id):
+    """
+    Run the registration tasks of the user created by UserCreateAPIView in the async mode
+    """
+    tasks = [verify_user_email.si(user_id)]
+    if not enrichment.is_deferred():
+        tasks.append(enrich_user.si(user_id))
+    tasks.append(send_activation_email.si(user_id))
+    return chain(*tasks).apply_async()
+
+
+@shared_task
+def backfill_additional_info(batch_size=100, limit=1000):
+    """
+    Fill the additional info of the users registered without it
+    """
+    result = enrichment.backfill_additional_info(batch_size=batch_size, limit=limit)
+    logger.info('Checked %d users, enriched %d in %.2fs', *result)
+    return result._asdict()
 
 
 @shared_task
-def hello():
-    print('Hello there!')
\ No newline at end of file
+def send_queued_emails(batch_size=100, max_messages=1000):
+    """
+    Send the emails enqueued in the 'queue' EMAIL_DELIVERY_MODE,
+    the emails taken by a killed run are sent again first.
+    Returns the number of sent emails.
+    """
+    rate_limit = settings.EMAIL_QUEUE_RATE_LIMIT
+    # one batch, the lock is extended before every next one
+    timeout = (batch_size // rate_limit if rate_limit else 0) + 60
+    lock = mail_queue.get_send_lock(timeout)
+    if not lock.acquire(blocking=False):
+        return 0
+    try:
+        requeued = mail_queue.requeue_stale_messages()
+        if requeued:
+            logger.warning('Returned %d emails of a killed run to the queue', requeued)
+        result = mail_queue.send_queued_emails(batch_size=batch_size, max_messages=max_messages, lock=lock)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning('The email send lock expired before the release')
+    if result.sent or result.retried or result.failed:
+        logger.info('Sent %d emails, %d to retry, %d failed in %.2fs', *result)
+    return result.sent
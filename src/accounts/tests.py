@@ -1,12 +1,36 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.core import mail
-from django.test import TestCase
+from django.core import mail, signing
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 from django.conf import settings
-from mock import Mock, patch
-
-from accounts.utils import GetAuthTokenMixin, HunterAPIClient
+from mock import ANY, MagicMock, call, patch
+from redis.exceptions import LockError
+
+from accounts.enrichment import backfill_additional_info
+from accounts.providers import ProviderClient, ProviderUnavailable
+from accounts.tasks import enrich_user, send_activation_email, send_queued_emails, verify_user_email
+from accounts.utils import (
+    ClearbitAPIClient,
+    ClearbitLookupQueued,
+    GetAuthTokenMixin,
+    HunterAPIClient,
+    QueryBudgetMixin,
+    get_additional_info,
+    get_hunter_stats,
+    hunter_local_cache,
+    hunter_local_stats
+)
+from simple_api import mail_queue
 
 User = get_user_model()
 
@@ -18,6 +42,62 @@ CLEARBIT_MOCK_DATA = {'person': {
 }}
 
 
+class FakeProviderServer(object):
+    """
+    Used instead of hunter.io and clearbit.com.
+    A local HTTP/1.1 server responding to GET requests with the queued
+    (status, data, delay) responses or with 200 {} when the queue is empty.
+    """
+    def __init__(self):
+        self.responses = []
+        self.paths = []
+        self.connections = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                fake.connections += 1
+
+            def do_GET(self):
+                fake.paths.append(self.path)
+                status, data, delay = fake.responses.pop(0) if fake.responses else (200, {}, 0)
+                time.sleep(delay)
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                # the client closed the connection after a timeout
+                pass
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+    def add_response(self, status=200, data=None, delay=0):
+        self.responses.append((status, data if data is not None else {}, delay))
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
 class UserModelTests(TestCase):
     """
     Test the User model and manager.
@@ -60,25 +140,26 @@ class UserModelTests(TestCase):
         self.assertIn(activation_key, email_inst.body)
 
 
-class ViewTests(GetAuthTokenMixin, TestCase):
+class ViewTests(GetAuthTokenMixin, QueryBudgetMixin, TestCase):
 
     def setUp(self):
+        cache.clear()
         self.user_data = {'email': 'test@mail.com',
                           'password': 'somepassword',
                           'first_name': 'John',
                           'last_name': 'Dou'}
 
-    @patch('clearbit.Enrichment')
+    @patch('accounts.utils.ClearbitAPIClient.find')
     @patch('accounts.utils.HunterAPIClient.email_verifier')
     def test_success_user_creation(self, mock_email_verifier, clearbit_mock):
-        clearbit_mock.find.return_value = None
+        clearbit_mock.return_value = None
         mock_email_verifier.return_value = 'deliverable'
         self.user_data['password1'] = self.user_data['password']
         response = self.client.post(reverse('api_accounts:register'),
                                     data=self.user_data)
         self.assertEqual(response.status_code, 201)
         mock_email_verifier.assert_called_with(self.user_data['email'])
-        clearbit_mock.find.assert_called_with(email=self.user_data['email'], stream=True)
+        clearbit_mock.assert_called_with(self.user_data['email'], company=True)
         self.assertEqual(User.objects.count(), 1)
         for key in self.user_data:
             if key in ['password', 'password1']:
@@ -91,10 +172,10 @@ class ViewTests(GetAuthTokenMixin, TestCase):
         self.assertFalse(new_user.is_active)
         self.assertFalse(new_user.is_superuser)
 
-    @patch('clearbit.Enrichment')
+    @patch('accounts.utils.ClearbitAPIClient.find')
     @patch('accounts.utils.HunterAPIClient.email_verifier')
     def test_getting_additional_data(self, mock_email_verifier, clearbit_mock):
-        clearbit_mock.find.return_value = CLEARBIT_MOCK_DATA
+        clearbit_mock.return_value = CLEARBIT_MOCK_DATA
         mock_email_verifier.return_value = 'deliverable'
         self.user_data['password1'] = self.user_data['password']
         response = self.client.post(reverse('api_accounts:register'),
@@ -102,7 +183,7 @@ class ViewTests(GetAuthTokenMixin, TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertEqual(User.objects.count(), 1)
         mock_email_verifier.assert_called_with(self.user_data['email'])
-        clearbit_mock.find.assert_called_with(email=self.user_data['email'], stream=True)
+        clearbit_mock.assert_called_with(self.user_data['email'], company=True)
 
         user = User.objects.get(email=self.user_data['email'])
         data = CLEARBIT_MOCK_DATA['person']
@@ -110,6 +191,7 @@ class ViewTests(GetAuthTokenMixin, TestCase):
         self.assertEqual(data.get('location'), user.location)
         self.assertEqual(data.get('bio'), user.bio)
         self.assertEqual(data.get('site'), user.site)
+        self.assertIsNotNone(user.enriched_at)
 
     @patch('accounts.utils.HunterAPIClient.email_verifier')
     def test_undeliverable_email(self, mock_email_verifier):
@@ -218,6 +300,336 @@ class ViewTests(GetAuthTokenMixin, TestCase):
                 self.assertEqual(response.data.get(key), self.user_data.get(key))
                 self.assertEqual(response.data.get(key), self.user_data.get(key))
 
+    def test_user_detail_view_sparse_fieldset(self):
+        new_user = User.objects.create_user(**self.user_data)
+        client = self.get_authorized_client(self.user_data['email'], self.user_data['password'])
+        url = reverse('api_accounts:detail', kwargs={'pk': new_user.pk})
+        response = client.get(url, {'fields': 'id,email'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data), ['id', 'email'])
+        response = client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_user_detail_view_conditional_get(self):
+        new_user = User.objects.create_user(**self.user_data)
+        client = self.get_authorized_client(self.user_data['email'], self.user_data['password'])
+        url = reverse('api_accounts:detail', kwargs={'pk': new_user.pk})
+        etag = client.get(url)['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        new_user.first_name = 'Jane'
+        new_user.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['first_name'], 'Jane')
+
+    def test_user_detail_view_queries(self):
+        new_user = User.objects.create_user(**self.user_data)
+        client = self.get_authorized_client(self.user_data['email'], self.user_data['password'])
+        url = reverse('api_accounts:detail', kwargs={'pk': new_user.pk})
+        self.assertQueryBudget(3, lambda: client.get(url),
+                               lambda number: [User.objects.create_user('user%d@mail.com' % i)
+                                               for i in range(User.objects.count(),
+                                                              User.objects.count() + number)])
+
+
+@override_settings(ACCOUNTS_REGISTRATION_MODE='async')
+class AsyncRegistrationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user_data = {'email': 'test@mail.com',
+                          'password': 'somepassword',
+                          'password1': 'somepassword',
+                          'first_name': 'John',
+                          'last_name': 'Dou'}
+
+    def register(self):
+        with patch('accounts.views.provision_user') as provision_mock:
+            response = self.client.post(reverse('api_accounts:register'), data=self.user_data)
+        self.assertEqual(response.status_code, 201)
+        return response, provision_mock
+
+    @patch('accounts.utils.ClearbitAPIClient.find')
+    @patch('accounts.utils.HunterAPIClient.email_verifier')
+    def test_registration_does_not_call_providers(self, mock_email_verifier, clearbit_mock):
+        response, provision_mock = self.register()
+        mock_email_verifier.assert_not_called()
+        clearbit_mock.assert_not_called()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(response.data['provisioning_status'], User.PROVISIONING_PENDING)
+        self.assertTrue(response.data['activation_key'])
+        user = User.objects.get(email=self.user_data['email'])
+        self.assertFalse(user.is_active)
+        # the tasks are started after the commit, which TestCase does not do
+        provision_mock.assert_not_called()
+
+    @patch('accounts.utils.ClearbitAPIClient.find')
+    @patch('accounts.utils.HunterAPIClient.email_verifier')
+    def test_provisioning(self, mock_email_verifier, clearbit_mock):
+        mock_email_verifier.return_value = 'deliverable'
+        clearbit_mock.return_value = {'person': {
+            'bio': 'some bio',
+            'location': 'x' * 200,
+            'site': 'https://google.com'
+        }}
+        response, _ = self.register()
+        user_id = response.data['id']
+        status_url = reverse('api_accounts:status', kwargs={'token': response.data['status_token']})
+        self.assertEqual(self.client.get(status_url).data,
+                         {'id': user_id, 'provisioning_status': User.PROVISIONING_PENDING})
+        # the user ids are not enumerable
+        self.assertEqual(self.client.get(reverse('api_accounts:status', kwargs={'token': user_id})).status_code, 404)
+        forged_token = signing.dumps(user_id, salt='other')
+        self.assertEqual(self.client.get(reverse('api_accounts:status', kwargs={'token': forged_token})).status_code,
+                         404)
+
+        verify_user_email.apply(args=(user_id,))
+        enrich_user.apply(args=(user_id,))
+        send_activation_email.apply(args=(user_id,))
+
+        user = User.objects.get(pk=user_id)
+        self.assertEqual(user.provisioning_status, User.PROVISIONING_READY)
+        self.assertEqual(user.bio, 'some bio')
+        self.assertEqual(user.site, 'https://google.com')
+        # too long for the field
+        self.assertEqual(user.location, '')
+        self.assertIsNotNone(user.enriched_at)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(user.generate_activation_key(), mail.outbox[0].body)
+        self.assertEqual(self.client.get(status_url).data['provisioning_status'], User.PROVISIONING_READY)
+
+    @patch('accounts.utils.HunterAPIClient.email_verifier')
+    def test_undeliverable_email(self, mock_email_verifier):
+        mock_email_verifier.return_value = 'undeliverable'
+        response, _ = self.register()
+        user_id = response.data['id']
+        verify_user_email.apply(args=(user_id,))
+        send_activation_email.apply(args=(user_id,))
+        self.assertEqual(User.objects.get(pk=user_id).provisioning_status, User.PROVISIONING_FAILED)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @patch('accounts.utils.HunterAPIClient.email_verifier')
+    def test_email_verification_retries(self, mock_email_verifier):
+        mock_email_verifier.side_effect = [None, None, 'deliverable']
+        response, _ = self.register()
+        verify_user_email.apply(args=(response.data['id'],))
+        self.assertEqual(mock_email_verifier.call_count, 3)
+        user = User.objects.get(pk=response.data['id'])
+        self.assertEqual(user.provisioning_status, User.PROVISIONING_PENDING)
+
+    @patch('accounts.models.send_email')
+    def test_failed_email_fails_provisioning(self, send_email_mock):
+        send_email_mock.side_effect = ValueError
+        response, _ = self.register()
+        send_activation_email.apply(args=(response.data['id'],))
+        user = User.objects.get(pk=response.data['id'])
+        self.assertEqual(user.provisioning_status, User.PROVISIONING_FAILED)
+
+
+class AdditionalInfoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @patch('accounts.utils.ClearbitAPIClient.find')
+    def test_additional_info_cache(self, clearbit_mock):
+        clearbit_mock.return_value = {'person': {'bio': 'some bio', 'location': None},
+                                      'company': {'location': 'company location'}}
+        for email in ('test@company.com', ' Test@Company.com'):
+            self.assertEqual(get_additional_info(email), {'bio': 'some bio', 'location': 'company location'})
+        self.assertEqual(clearbit_mock.call_count, 1)
+        clearbit_mock.assert_called_with('test@company.com', company=True)
+
+        # the company of the domain is cached
+        clearbit_mock.return_value = {'person': {'bio': 'other bio'}}
+        self.assertEqual(get_additional_info('other@company.com'), {'bio': 'other bio', 'location': 'company location'})
+        clearbit_mock.assert_called_with('other@company.com', company=False)
+
+        # not found
+        clearbit_mock.return_value = {}
+        self.assertIsNone(get_additional_info('unknown@mail.com'))
+        self.assertIsNone(get_additional_info('unknown@mail.com'))
+        self.assertEqual(clearbit_mock.call_count, 3)
+        clearbit_mock.assert_called_with('unknown@mail.com', company=True)
+        self.assertIsNone(get_additional_info('another@mail.com'))
+        clearbit_mock.assert_called_with('another@mail.com', company=False)
+        # a not found company does not replace the cached one
+        cache.set('accounts:clearbit:company:mail.com', {'location': 'mail location'})
+        with patch('accounts.utils.cache.get_many', return_value={}):
+            self.assertIsNone(get_additional_info('third@mail.com'))
+        self.assertEqual(cache.get('accounts:clearbit:company:mail.com'), {'location': 'mail location'})
+
+        # queued lookups are not cached
+        clearbit_mock.side_effect = ClearbitLookupQueued
+        for _ in range(2):
+            with self.assertRaises(ClearbitLookupQueued):
+                get_additional_info('queued@mail.com')
+        self.assertEqual(clearbit_mock.call_count, 7)
+
+    @patch('accounts.utils.ClearbitAPIClient.find')
+    @patch('accounts.utils.HunterAPIClient.email_verifier')
+    def test_queued_lookup_is_not_enriched(self, mock_email_verifier, clearbit_mock):
+        mock_email_verifier.return_value = 'deliverable'
+        clearbit_mock.side_effect = ClearbitLookupQueued
+        response = self.client.post(reverse('api_accounts:register'), data={
+            'email': 'test@mail.com',
+            'password': 'somepassword',
+            'password1': 'somepassword',
+            'first_name': 'John',
+            'last_name': 'Dou'
+        })
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(pk=response.data['id'])
+        self.assertIsNone(user.enriched_at)
+        User.objects.filter(pk=user.pk).update(provisioning_status=User.PROVISIONING_PENDING)
+        enrich_user.apply(args=(user.pk,))
+        self.assertIsNone(User.objects.get(pk=user.pk).enriched_at)
+        other_user = User.objects.create_user('other@mail.com', 'somepassword')
+
+        clearbit_mock.side_effect = [ClearbitLookupQueued, CLEARBIT_MOCK_DATA]
+        result = backfill_additional_info()
+        self.assertEqual((result.checked, result.enriched), (2, 1))
+        self.assertIsNone(User.objects.get(pk=user.pk).enriched_at)
+        self.assertIsNotNone(User.objects.get(pk=other_user.pk).enriched_at)
+
+        clearbit_mock.side_effect = None
+        clearbit_mock.return_value = CLEARBIT_MOCK_DATA
+        self.assertEqual(backfill_additional_info().enriched, 1)
+        user = User.objects.get(pk=user.pk)
+        self.assertIsNotNone(user.enriched_at)
+        self.assertEqual(user.bio, CLEARBIT_MOCK_DATA['person']['bio'])
+
+    @override_settings(ACCOUNTS_ENRICHMENT_MODE='deferred')
+    @patch('accounts.utils.ClearbitAPIClient.find')
+    @patch('accounts.utils.HunterAPIClient.email_verifier')
+    def test_deferred_enrichment(self, mock_email_verifier, clearbit_mock):
+        mock_email_verifier.return_value = 'deliverable'
+        clearbit_mock.return_value = CLEARBIT_MOCK_DATA
+        response = self.client.post(reverse('api_accounts:register'), data={
+            'email': 'test@mail.com',
+            'password': 'somepassword',
+            'password1': 'somepassword',
+            'first_name': 'John',
+            'last_name': 'Dou'
+        })
+        self.assertEqual(response.status_code, 201)
+        clearbit_mock.assert_not_called()
+        user = User.objects.get(pk=response.data['id'])
+        self.assertIsNone(user.enriched_at)
+        self.assertEqual(user.bio, '')
+        enriched_user = User.objects.create_user('enriched@mail.com', 'somepassword', enriched_at=timezone.now())
+
+        clearbit_mock.side_effect = ProviderUnavailable
+        self.assertEqual(backfill_additional_info().checked, 0)
+        self.assertIsNone(User.objects.get(pk=user.pk).enriched_at)
+
+        clearbit_mock.side_effect = None
+        result = backfill_additional_info(batch_size=1)
+        self.assertEqual((result.checked, result.enriched), (1, 1))
+        user = User.objects.get(pk=user.pk)
+        self.assertIsNotNone(user.enriched_at)
+        self.assertEqual(user.bio, CLEARBIT_MOCK_DATA['person']['bio'])
+        self.assertEqual(user.location, CLEARBIT_MOCK_DATA['person']['location'])
+        self.assertEqual(User.objects.get(pk=enriched_user.pk).bio, '')
+        self.assertEqual(backfill_additional_info().checked, 0)
+
+
+@override_settings(EMAIL_DELIVERY_MODE='queue', EMAIL_QUEUE_RATE_LIMIT=0, EMAIL_QUEUE_MAX_ATTEMPTS=2)
+class EmailQueueTests(TestCase):
+    """
+    Test the Redis queue of the outgoing emails.
+
+    """
+
+    def setUp(self):
+        self.redis = MagicMock()
+        patcher = patch('simple_api.mail_queue.get_redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pipe = self.redis.pipeline.return_value
+
+    def queue_messages(self, *recipients):
+        payloads = [json.dumps({'subject': 'subject', 'body': 'body', 'from_email': settings.ADMIN_EMAIL,
+                                'to': [recipient], 'attempts': 0}).encode() for recipient in recipients]
+        # the batch, then the pipelines of the failures and the empty queue
+        self.pipe.execute.side_effect = [payloads] + [[]] * 3
+        self.redis.lrange.return_value = []
+        return payloads
+
+    def test_activation_email_queued(self):
+        user = User.objects.create_inactive_user('test@mail.com', 'somepassword')
+        with patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            user.send_activation_email()
+        self.assertEqual(len(mail.outbox), 0)
+        key, payload = self.redis.lpush.call_args[0]
+        self.assertEqual(key, 'mail:queue')
+        message = json.loads(payload)
+        self.assertEqual(message['to'], ['test@mail.com'])
+        self.assertIn(user.generate_activation_key(), message['body'])
+
+    def test_send_batch_over_one_connection(self):
+        payloads = self.queue_messages('first@mail.com', 'second@mail.com')
+        with patch('simple_api.mail_queue.get_connection', wraps=mail.get_connection) as get_connection_mock:
+            self.assertEqual(send_queued_emails(batch_size=10), 2)
+        self.assertEqual(get_connection_mock.call_count, 1)
+        self.assertEqual([message.to for message in mail.outbox], [['first@mail.com'], ['second@mail.com']])
+        self.pipe.rpoplpush.assert_called_with('mail:queue', 'mail:processing')
+        self.assertEqual(self.pipe.rpoplpush.call_count, 20)
+        # removed from the processing list when sent
+        self.assertEqual(self.redis.lrem.call_args_list,
+                         [call('mail:processing', -1, payload) for payload in payloads])
+
+    def test_transient_failure(self):
+        payloads = self.queue_messages('first@mail.com', 'second@mail.com', 'third@mail.com')
+        connection = MagicMock()
+        connection.send_messages.side_effect = [1, SMTPServerDisconnected(), 1]
+        with patch('simple_api.mail_queue.get_connection', return_value=connection):
+            result = mail_queue.send_queued_emails()
+        self.assertEqual((result.sent, result.retried, result.failed), (1, 1, 0))
+        connection.close.assert_called_with()
+        self.redis.lrem.assert_called_once_with('mail:processing', -1, payloads[0])
+        # the failed and the not sent messages are returned in order
+        self.assertEqual(self.pipe.lrem.call_args_list,
+                         [call('mail:processing', -1, payload) for payload in payloads[1:]])
+        key, third, second = self.pipe.rpush.call_args[0]
+        self.assertEqual(key, 'mail:queue')
+        self.assertEqual((json.loads(second)['to'], json.loads(second)['attempts']), (['second@mail.com'], 1))
+        self.assertEqual((json.loads(third)['to'], json.loads(third)['attempts']), (['third@mail.com'], 0))
+
+    def test_permanent_failure(self):
+        payloads = self.queue_messages('first@mail.com', 'second@mail.com')
+        connection = MagicMock()
+        connection.send_messages.side_effect = [SMTPRecipientsRefused({}), 1]
+        with patch('simple_api.mail_queue.get_connection', return_value=connection):
+            result = mail_queue.send_queued_emails()
+        self.assertEqual((result.sent, result.retried, result.failed), (1, 0, 1))
+        self.pipe.lrem.assert_called_once_with('mail:processing', -1, payloads[0])
+        key, payload = self.pipe.rpush.call_args[0]
+        self.assertEqual((key, json.loads(payload)['to']), ('mail:failed', ['first@mail.com']))
+        self.redis.lrem.assert_called_once_with('mail:processing', -1, payloads[1])
+
+    def test_lost_lock_stops_sending(self):
+        payloads = self.queue_messages('first@mail.com', 'second@mail.com')
+        self.pipe.execute.side_effect = [[payloads[0]], [payloads[1]], []]
+        lock = self.redis.lock.return_value
+        lock.extend.side_effect = LockError
+        lock.release.side_effect = LockError
+        self.assertEqual(send_queued_emails(batch_size=1), 1)
+        lock.extend.assert_called_once_with(ANY)
+        self.redis.lock.assert_called_once_with('mail:send-lock', timeout=60)
+        self.assertEqual([message.to for message in mail.outbox], [['first@mail.com']])
+
+    def test_stale_messages_requeued(self):
+        payloads = self.queue_messages('first@mail.com', 'second@mail.com')
+        # left by a killed run, newest first
+        self.redis.lrange.return_value = list(reversed(payloads))
+        self.pipe.execute.side_effect = [[2, True], payloads, []]
+        self.assertEqual(send_queued_emails(), 2)
+        self.pipe.rpush.assert_called_once_with('mail:queue', payloads[1], payloads[0])
+        self.pipe.ltrim.assert_called_once_with('mail:processing', 0, -3)
+        self.assertEqual([message.to for message in mail.outbox], [['first@mail.com'], ['second@mail.com']])
+
 
 class HunterAPIClientTests(TestCase):
     api_key = settings.HUNTER_API_KEY
@@ -225,23 +637,141 @@ class HunterAPIClientTests(TestCase):
     resp_data = {'data': {'result': 'ok'}}
 
     def setUp(self):
-        self.hunter_client = HunterAPIClient(self.api_key)
-        self.url = HunterAPIClient.email_verif_url.format(email=self.email, key=self.api_key)
-        mock_resp = Mock()
-        mock_resp.json = Mock(return_value=self.resp_data)
-        mock_resp.status_code = 200
-        self.mock_resp = mock_resp
+        cache.clear()
+        hunter_local_cache.clear()
+        hunter_local_stats.clear()
+        self.server = FakeProviderServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        provider = ProviderClient('hunter', retries=0)
+        self.hunter_client = HunterAPIClient(self.api_key, provider=provider)
+        self.hunter_client.email_verif_url = self.server.url + '/v2/email-verifier?email={email}&api_key={key}'
+        self.url = self.hunter_client.email_verif_url.format(email=self.email, key=self.api_key)
 
     def test_get_url(self):
         self.assertEqual(self.url, self.hunter_client.get_url(self.email))
+        self.assertEqual(HunterAPIClient(self.api_key).get_url(self.email),
+                         HunterAPIClient.email_verif_url.format(email=self.email, key=self.api_key))
 
-    @patch('requests.get')
-    def test_get_response_200(self, mock_get):
-        mock_get.return_value = self.mock_resp
+    def test_get_response_200(self):
+        self.server.add_response(data=self.resp_data)
         response = self.hunter_client.get_response(self.url)
         self.assertEqual(response.json(), self.resp_data)
 
-    @patch('requests.get')
-    def test_email_verifier(self, mock_get):
-        mock_get.return_value = self.mock_resp
-        self.assertEqual(self.hunter_client.email_verifier(self.url), self.resp_data['data']['result'])
+    def test_email_verifier(self):
+        self.server.add_response(data=self.resp_data)
+        self.assertEqual(self.hunter_client.email_verifier(self.email), self.resp_data['data']['result'])
+        self.assertEqual(self.server.paths, ['/v2/email-verifier?email=%s&api_key=%s' % (self.email, self.api_key)])
+
+    def test_email_verifier_cache(self):
+        self.server.add_response(data={'data': {'result': 'deliverable'}})
+        self.assertEqual(self.hunter_client.email_verifier(self.email), 'deliverable')
+        # normalized email
+        self.assertEqual(self.hunter_client.email_verifier(' Email@Com.ua'), 'deliverable')
+        # another process has only the shared cache
+        hunter_local_cache.clear()
+        self.assertEqual(self.hunter_client.email_verifier(self.email), 'deliverable')
+        self.assertEqual(len(self.server.paths), 1)
+        stats = get_hunter_stats()
+        self.assertEqual((stats['local_hits'], stats['shared_hits'], stats['misses']), (1, 1, 1))
+
+    def test_local_hits_do_not_use_shared_cache(self):
+        self.server.add_response(data={'data': {'result': 'deliverable'}})
+        self.hunter_client.email_verifier(self.email)
+        with patch('accounts.utils.cache') as cache_mock:
+            self.assertEqual(self.hunter_client.email_verifier(self.email), 'deliverable')
+        self.assertEqual(cache_mock.mock_calls, [])
+        self.assertEqual(get_hunter_stats()['local_hits'], 1)
+
+    def test_email_verifier_domain_cache(self):
+        self.server.add_response(data={'data': {'result': 'undeliverable', 'mx_records': False}})
+        self.assertEqual(self.hunter_client.email_verifier('first@nomx.com'), 'undeliverable')
+        self.assertEqual(self.hunter_client.email_verifier('second@nomx.com'), 'undeliverable')
+        self.assertEqual(len(self.server.paths), 1)
+
+        self.server.add_response(data={'data': {'result': 'deliverable', 'mx_records': True}})
+        self.server.add_response(data={'data': {'result': 'deliverable', 'mx_records': True}})
+        self.hunter_client.email_verifier('first@mx.com')
+        self.hunter_client.email_verifier('second@mx.com')
+        self.assertEqual(len(self.server.paths), 3)
+
+    def test_email_verifier_errors_not_cached(self):
+        self.server.add_response(status=503)
+        self.server.add_response(status=503)
+        self.assertIsNone(self.hunter_client.email_verifier(self.email))
+        self.assertIsNone(self.hunter_client.email_verifier(self.email))
+        self.assertEqual(len(self.server.paths), 2)
+
+
+class ProviderClientTests(TestCase):
+
+    def setUp(self):
+        self.server = FakeProviderServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_connection_reuse(self):
+        provider = ProviderClient('test')
+        for _ in range(3):
+            self.assertEqual(provider.get(self.server.url).status_code, 200)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_retries(self):
+        provider = ProviderClient('test', retries=2, backoff_factor=0)
+        self.server.add_response(status=503)
+        self.server.add_response(status=502)
+        self.server.add_response(data={'result': 'ok'})
+        self.assertEqual(provider.get(self.server.url).json(), {'result': 'ok'})
+        self.assertEqual(len(self.server.paths), 3)
+
+        self.server.add_response(status=503)
+        self.server.add_response(status=503)
+        self.server.add_response(status=503)
+        with self.assertRaises(ProviderUnavailable):
+            provider.get(self.server.url)
+
+    def test_read_timeout(self):
+        provider = ProviderClient('test', read_timeout=0.1, retries=0)
+        self.server.add_response(delay=0.5)
+        start = time.time()
+        with self.assertRaises(ProviderUnavailable):
+            provider.get(self.server.url)
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_circuit_breaker(self):
+        provider = ProviderClient('test', retries=0, failure_threshold=2, reset_timeout=0.2)
+        self.server.add_response(status=500)
+        self.server.add_response(status=500)
+        for _ in range(2):
+            with self.assertRaises(ProviderUnavailable):
+                provider.get(self.server.url)
+        self.assertTrue(provider.breaker.is_open)
+        # fails fast without a request
+        with self.assertRaises(ProviderUnavailable):
+            provider.get(self.server.url)
+        self.assertEqual(len(self.server.paths), 2)
+
+        time.sleep(0.2)
+        # the trial request closes the breaker
+        self.assertEqual(provider.get(self.server.url).status_code, 200)
+        self.assertFalse(provider.breaker.is_open)
+
+    def test_clearbit_client_is_not_retried(self):
+        retry = ClearbitAPIClient('key').provider.session.get_adapter('https://').max_retries
+        self.assertEqual(retry.total, 0)
+
+    def test_clearbit_client(self):
+        clearbit_client = ClearbitAPIClient('key', provider=ProviderClient('clearbit', retries=0))
+        clearbit_client.combined_url = self.server.url + '/v2/combined/find'
+        clearbit_client.person_url = self.server.url + '/v2/people/find'
+        self.server.add_response(data=CLEARBIT_MOCK_DATA)
+        self.server.add_response(status=404)
+        self.server.add_response(status=202)
+        self.server.add_response(data=CLEARBIT_MOCK_DATA['person'])
+        self.assertEqual(clearbit_client.find('test@mail.com'), CLEARBIT_MOCK_DATA)
+        self.assertEqual(clearbit_client.find('test@mail.com'), {})
+        with self.assertRaises(ClearbitLookupQueued):
+            clearbit_client.find('test@mail.com')
+        self.assertEqual(clearbit_client.find('test@mail.com', company=False), CLEARBIT_MOCK_DATA)
+        self.assertEqual(self.server.paths[0], '/v2/combined/find?email=test%40mail.com')
+        self.assertEqual(self.server.paths[3], '/v2/people/find?email=test%40mail.com')
@@ -2,10 +2,12 @@ from django.conf.urls import url
 from .views import (
     UserCreateAPIView,
     UserDetailAPIView,
+    UserProvisioningStatusAPIView,
 )
 
 urlpatterns = [
     url(r'^register/$', UserCreateAPIView.as_view(), name='register'),
     url(r'^detail/(?P<pk>\d+)/$', UserDetailAPIView.as_view(), name='detail'),
+    url(r'^status/(?P<token>[\w:-]+)/$', UserProvisioningStatusAPIView.as_view(), name='status'),
 
 ]
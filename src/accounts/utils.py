@@ -1,11 +1,17 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.conf import settings
 
-import requests
-import clearbit
-from requests import HTTPError
 from rest_framework.test import APIClient
 
+from .providers import ProviderUnavailable, get_provider_client
+
 
 class GetAuthTokenMixin(object):
     """
@@ -24,53 +30,229 @@ class GetAuthTokenMixin(object):
         return client
 
 
-def get_additional_info(email):
+class QueryBudgetMixin(object):
     """
-    get additional info by email for user
+    Used in tests for checking the number of SQL queries of a view.
+    The view must make the same number of queries, not more than the budget,
+    for every size of the data.
     """
-    clearbit.key = settings.CLEARBIT_KEY
-    try:
-        lookup = clearbit.Enrichment.find(email=email, stream=True)
-    except HTTPError:
-        return None
-    if lookup:
-        person_data = lookup['person']
-        if person_data:
-            bio = person_data.get('bio')
-            location = person_data.get('location')
-            site = person_data.get('site')
-            data = {
-                'bio': bio,
-                'location': location,
-                'site': site
-            }
-            return data
+    query_budget_sizes = (1, 5, 20)
+
+    def assertQueryBudget(self, budget, make_request, fill_data, sizes=None):
+        """
+        fill_data(n) - add n more rows of the data
+        make_request() - make the request and return the response
+        """
+        counts = []
+        filled = 0
+        for size in sizes or self.query_budget_sizes:
+            fill_data(size - filled)
+            filled = size
+            with CaptureQueriesContext(connection) as context:
+                response = make_request()
+            self.assertLess(response.status_code, 400)
+            counts.append(len(context))
+        self.assertLessEqual(max(counts), budget,
+                             'Queries %s are over the budget %d' % (counts, budget))
+        self.assertEqual(len(set(counts)), 1,
+                         'Queries %s grow with the data size %s' % (counts, sizes or self.query_budget_sizes))
+
+
+CLEARBIT_PERSON_KEY = 'accounts:clearbit:person:%s'
+CLEARBIT_COMPANY_KEY = 'accounts:clearbit:company:%s'
+# cached for the emails and the domains clearbit.com has no data of
+CLEARBIT_NOT_FOUND = {}
+
+HUNTER_EMAIL_KEY = 'accounts:hunter:email:%s'
+HUNTER_DOMAIN_KEY = 'accounts:hunter:domain:%s'
+HUNTER_STATS_KEY = 'accounts:hunter:stats:%s'
+HUNTER_STATS = ('local_hits', 'shared_hits', 'misses', 'upstream_ms')
+
+
+class LocalTTLCache(object):
+    """
+    In-process LRU cache with an expiry time of every item.
+    It is not shared between the worker processes, so its timeout should be short.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        if self.max_size <= 0 or timeout <= 0:
+            return
+        with self._lock:
+            self._items[key] = (value, time.time() + timeout)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class LocalCounters(object):
+    """
+    In-process counters added to the Django cache by flush(),
+    at most every flush_interval seconds
+    """
+    def __init__(self, key, flush_interval):
+        self.key = key
+        self.flush_interval = flush_interval
+        self._counts = Counter()
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counts[name] += value
+
+    def flush(self, force=False):
+        with self._lock:
+            if not force and time.time() - self._flushed < self.flush_interval:
+                return
+            counts, self._counts = self._counts, Counter()
+            self._flushed = time.time()
+        for name, value in counts.items():
+            key = self.key % name
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+hunter_local_cache = LocalTTLCache(settings.HUNTER_LOCAL_CACHE_SIZE)
+hunter_local_stats = LocalCounters(HUNTER_STATS_KEY, settings.HUNTER_STATS_FLUSH_INTERVAL)
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def get_hunter_cache_timeout(result):
+    if result == 'deliverable':
+        return settings.HUNTER_CACHE_DELIVERABLE_TIMEOUT
+    if result == 'undeliverable':
+        return settings.HUNTER_CACHE_UNDELIVERABLE_TIMEOUT
+    return settings.HUNTER_CACHE_UNKNOWN_TIMEOUT
+
+
+def count_hunter_lookup(name, value=1):
+    """
+    Count in the process, the counts are flushed to the Django cache
+    on the lookups which go to the network anyway
+    """
+    hunter_local_stats.incr(name, value)
+
+
+def get_hunter_stats():
+    """
+    Return {'local_hits': n, 'shared_hits': n, 'misses': n, 'upstream_ms': n}
+    """
+    hunter_local_stats.flush(force=True)
+    values = cache.get_many([HUNTER_STATS_KEY % name for name in HUNTER_STATS])
+    return {name: values.get(HUNTER_STATS_KEY % name, 0) for name in HUNTER_STATS}
+
+
+def get_cached_hunter_result(email):
+    """
+    Return the cached result of the normalized email or of its domain, None if not cached.
+    The in-process cache is checked before the shared one.
+    """
+    keys = [HUNTER_EMAIL_KEY % email, HUNTER_DOMAIN_KEY % email.rpartition('@')[2]]
+    for key in keys:
+        result = hunter_local_cache.get(key)
+        if result is not None:
+            count_hunter_lookup('local_hits')
+            return result
+    results = cache.get_many(keys)
+    for key in keys:
+        result = results.get(key)
+        if result is not None:
+            hunter_local_cache.set(key, result, settings.HUNTER_LOCAL_CACHE_TIMEOUT)
+            count_hunter_lookup('shared_hits')
+            hunter_local_stats.flush()
+            return result
+    return None
+
+
+def set_cached_hunter_result(email, data):
+    """
+    Cache the result of the email. The result of a domain without MX records
+    or accepting all addresses is the same for every address, so it is cached
+    for the domain too.
+    """
+    result = data.get('result')
+    timeout = get_hunter_cache_timeout(result)
+    keys = [HUNTER_EMAIL_KEY % email]
+    if data.get('mx_records') is False or data.get('accept_all'):
+        keys.append(HUNTER_DOMAIN_KEY % email.rpartition('@')[2])
+    cache.set_many({key: result for key in keys}, timeout)
+    for key in keys:
+        hunter_local_cache.set(key, result, min(timeout, settings.HUNTER_LOCAL_CACHE_TIMEOUT))
 
 
 class HunterAPIClient(object):
     """
-    Client for working with hunter.io API
+    Client for working with hunter.io API.
+    The results are cached by the normalized email, see get_cached_hunter_result()
     """
     # endpoint
     email_verif_url = 'https://api.hunter.io/v2/email-verifier?email={email}&api_key={key}'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, provider=None):
         self.api_key = api_key
+        self.provider = provider or get_provider_client('hunter')
 
     def get_url(self, email):
         return self.email_verif_url.format(email=email, key=self.api_key)
 
     def email_verifier(self, email):
+        email = normalize_email(email)
+        result = get_cached_hunter_result(email)
+        if result is not None:
+            return result
+        start = time.time()
+        data = self.get_email_data(email)
+        count_hunter_lookup('misses')
+        count_hunter_lookup('upstream_ms', int((time.time() - start) * 1000))
+        hunter_local_stats.flush()
+        if not data:
+            return None
+        # failed requests are not cached, they are retried
+        if data.get('result'):
+            set_cached_hunter_result(email, data)
+        return data.get('result')
+
+    def get_email_data(self, email):
         url = self.get_url(email)
         response = self.get_response(url)
         if response:
-            data = response.json().get('data')
-            return data.get('result') if data else None
+            return response.json().get('data')
 
     def get_response(self, url):
         try:
-            response = requests.get(url)
-        except requests.exceptions.ConnectionError as error:
+            response = self.provider.get(url)
+        except ProviderUnavailable:
             return None
         if response.status_code == 200:
             return response
@@ -78,3 +260,94 @@ class HunterAPIClient(object):
 
 def get_hunter_client():
     return HunterAPIClient(settings.HUNTER_API_KEY)
+
+
+class ClearbitLookupQueued(Exception):
+    """
+    clearbit.com has queued the lookup, the data is not known yet
+    """
+
+
+class ClearbitAPIClient(object):
+    """
+    Client for working with clearbit.com Enrichment API
+    """
+    # streaming endpoints, they respond when the lookup is done
+    combined_url = 'https://person-stream.clearbit.com/v2/combined/find'
+    person_url = 'https://person-stream.clearbit.com/v2/people/find'
+
+    def __init__(self, api_key, provider=None):
+        self.api_key = api_key
+        self.provider = provider or get_provider_client('clearbit', retries=settings.CLEARBIT_RETRIES)
+
+    def find(self, email, company=True):
+        """
+        Return the combined person and company data ({'person': ...} only
+        without the company), {} if not found, None if the request is invalid.
+        Raises ClearbitLookupQueued and ProviderUnavailable.
+        """
+        url = self.combined_url if company else self.person_url
+        response = self.provider.get(url, params={'email': email}, auth=(self.api_key, ''),
+                                     timeout=(settings.PROVIDER_CONNECT_TIMEOUT, settings.CLEARBIT_READ_TIMEOUT))
+        if response.status_code == 200:
+            return response.json() if company else {'person': response.json()}
+        if response.status_code == 404:
+            return {}
+        if response.status_code == 202:
+            raise ClearbitLookupQueued('clearbit.com queued the lookup of %s' % email)
+        # bad request or key
+        return None
+
+
+def get_clearbit_client():
+    return ClearbitAPIClient(settings.CLEARBIT_KEY)
+
+
+def get_person_info(person):
+    if person:
+        return {
+            'bio': person.get('bio'),
+            'location': person.get('location'),
+            'site': person.get('site')
+        }
+    return CLEARBIT_NOT_FOUND
+
+
+def get_company_info(company):
+    if company:
+        return {'location': company.get('location')}
+    return CLEARBIT_NOT_FOUND
+
+
+def get_additional_info(email):
+    """
+    get additional info by email for user, None if clearbit.com has none.
+    The person data is cached by the email for a short time, the company
+    data by the domain for a long time, so the emails of a cached domain are
+    looked up without the company. The location of the company is used
+    when the person has none. Raises ClearbitLookupQueued, which is not cached,
+    and ProviderUnavailable.
+    """
+    email = normalize_email(email)
+    person_key = CLEARBIT_PERSON_KEY % email
+    company_key = CLEARBIT_COMPANY_KEY % email.rpartition('@')[2]
+    cached = cache.get_many([person_key, company_key])
+    person, company = cached.get(person_key), cached.get(company_key)
+    if person is None:
+        lookup = get_clearbit_client().find(email, company=company is None)
+        if lookup is None:
+            return None
+        person = get_person_info(lookup.get('person'))
+        cache.set(person_key, person, settings.CLEARBIT_PERSON_CACHE_TIMEOUT if person
+                  else settings.CLEARBIT_NOT_FOUND_CACHE_TIMEOUT)
+        if company is None:
+            company = get_company_info(lookup.get('company'))
+            if company:
+                cache.set(company_key, company, settings.CLEARBIT_COMPANY_CACHE_TIMEOUT)
+            else:
+                # the company cached by a concurrent lookup is kept
+                cache.add(company_key, company, settings.CLEARBIT_NOT_FOUND_CACHE_TIMEOUT)
+    data = {name: value for name, value in person.items() if value}
+    if not data.get('location') and company and company.get('location'):
+        data['location'] = company['location']
+    return data or None
@@ -1,9 +1,18 @@
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
 
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import (
     CreateAPIView,
@@ -11,47 +20,114 @@ from rest_framework.generics import (
     )
 from rest_framework.response import Response
 
+from simple_api.query_plans import SerializerQuerysetMixin
+
 from .serializers import (
     UserCreateSerializer,
     UserDetailSerializer,
+    UserProvisioningStatusSerializer,
 )
-from .utils import get_additional_info
+from .enrichment import is_deferred as is_enrichment_deferred
+from .providers import ProviderUnavailable
+from .tasks import provision_user
+from .utils import ClearbitLookupQueued, get_additional_info
 
 User = get_user_model()
 
 
-class UserDetailAPIView(RetrieveAPIView):
+def user_detail_etag(request, pk):
+    """
+    ETag of the user detail response from the serialized columns (one light query)
+    """
+    row = User.objects.filter(pk=pk).values_list(*UserDetailSerializer.Meta.fields).first()
+    if row is None:
+        return None
+    parts = (row, request.get_full_path(), request.META.get('HTTP_ACCEPT', ''))
+    return '"%s"' % hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+@method_decorator(condition(etag_func=user_detail_etag), name='get')
+class UserDetailAPIView(SerializerQuerysetMixin, RetrieveAPIView):
     serializer_class = UserDetailSerializer
     queryset = User.objects.all()
     permission_classes = [IsAuthenticated]
 
 
 class UserCreateAPIView(CreateAPIView):
+    """
+    Register an inactive user. In the 'async' ACCOUNTS_REGISTRATION_MODE the user
+    is created as pending and the email check, the additional info and the
+    activation email are done by Celery tasks, see UserProvisioningStatusAPIView
+    """
     serializer_class = UserCreateSerializer
     queryset = User.objects.all()
 
+    def is_async(self):
+        return settings.ACCOUNTS_REGISTRATION_MODE == 'async'
+
+    def get_serializer_context(self):
+        context = super(UserCreateAPIView, self).get_serializer_context()
+        context['verify_email'] = not self.is_async()
+        return context
+
     def get_full_data(self, request):
         """
         get additional data for user from clearbit.com
-        return request.data wit additional data
+        return request.data wit additional data and whether it was looked up,
+        the additional data is left to the backfill when it is deferred,
+        queued by clearbit.com or clearbit.com is unavailable
         """
+        if is_enrichment_deferred():
+            return request.data, False
         email = request.data.get('email')
-        additional_data = get_additional_info(email)
+        try:
+            additional_data = get_additional_info(email)
+        except (ClearbitLookupQueued, ProviderUnavailable):
+            return request.data, False
         if additional_data:
             data = request.data.copy()
             data.update(additional_data)
-            return data
-        return request.data
+            return data, True
+        return request.data, True
 
     def create(self, request, *args, **kwargs):
-        data = self.get_full_data(request)
+        if self.is_async():
+            return self.create_async(request)
+        data, enriched = self.get_full_data(request)
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
-        user_inst = serializer.save()
+        user_inst = serializer.save(enriched_at=timezone.now() if enriched else None)
         user_inst.send_activation_email()
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    def create_async(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            user_inst = serializer.save(provisioning_status=User.PROVISIONING_PENDING)
+            transaction.on_commit(lambda: provision_user(user_inst.pk))
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+
+class UserProvisioningStatusAPIView(RetrieveAPIView):
+    """
+    Provisioning status of a registered user: pending, ready or failed.
+    The user is looked up by the status_token of the registration response,
+    which is valid for token_max_age seconds.
+    """
+    serializer_class = UserProvisioningStatusSerializer
+    queryset = User.objects.only('id', 'provisioning_status')
+    token_max_age = 24 * 3600
+
+    def get_object(self):
+        try:
+            pk = signing.loads(self.kwargs['token'], salt=User.STATUS_TOKEN_SALT, max_age=self.token_max_age)
+        except signing.BadSignature:
+            raise NotFound()
+        return get_object_or_404(self.get_queryset(), pk=pk)
+
 
 class ActivationView(TemplateView):
     template_name = 'accounts/activate.html'
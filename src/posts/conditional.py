@@ -0,0 +1,66 @@
+"""
+ETag and Last-Modified of the post responses for conditional GET requests,
+computed by one light query without serializing the response.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+
+from . import counters
+from .models import Post
+from .response_cache import LIST_VERSION_KEY, get_users_changed, get_version
+
+
+def make_etag(request, *parts):
+    """
+    Strong ETag of the representation: the data parts, the full path
+    (query params like ?likes=1), the accepted media type and the user
+    (liked_by_me is different for every user; a like changes the post state)
+    """
+    user = getattr(request, 'user', None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    parts += (request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), user_id)
+    return '"%s"' % hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def get_post_detail_state(request, pk):
+    """
+    Return (etag, last_modified) of the post, the result is kept on the request.
+    The post has the author and the liking users, so their changes are included.
+    """
+    if not hasattr(request, '_post_state'):
+        row = Post.objects.filter(pk=pk).values_list('updated', 'number_of_likes').first()
+        users_version, users_changed = get_users_changed()
+        if row is None:
+            request._post_state = (None, None)
+        elif counters.is_buffered():
+            # the likes not flushed yet don't change the updated field
+            pending = counters.get_pending_deltas([int(pk)]).get(int(pk), 0)
+            request._post_state = (make_etag(request, row, pending, users_version), None)
+        else:
+            request._post_state = (make_etag(request, row, users_version), max(row[0], users_changed))
+    return request._post_state
+
+
+def post_detail_etag(request, pk):
+    return get_post_detail_state(request, pk)[0]
+
+
+def post_detail_last_modified(request, pk):
+    return get_post_detail_state(request, pk)[1]
+
+
+def post_list_etag(request):
+    """
+    ETag of the published posts. The list has no Last-Modified: deleting, hiding
+    or unpublishing a post does not raise the greatest updated field, the count
+    in the ETag covers them.
+    """
+    if request.GET.get('include'):
+        # the side-loaded objects are not covered by the state
+        return None
+    state = Post.objects.get_active_posts().aggregate(count=Count('pk'), updated=Max('updated'))
+    if counters.is_buffered():
+        # bumped by every like change
+        return make_etag(request, state['count'], state['updated'], get_version(LIST_VERSION_KEY))
+    return make_etag(request, state['count'], state['updated'])
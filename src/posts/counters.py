@@ -0,0 +1,136 @@
+"""
+Write-behind buffer for Post.number_of_likes.
+
+With POSTS_LIKES_COUNTER = 'redis' like deltas are accumulated in a Redis hash
+instead of updating the post row on every like. The posts.tasks.flush_likes_counters
+task moves the hash aside and applies it to the posts_post table in batches,
+the hash being moved aside is only deleted after the database commit, so a crashed
+worker leaves it to the next flush. Every moved aside hash gets a flush id, which is
+saved (LikesCounterFlush) in the transaction applying it: a flush whose id is saved is
+not applied again and its deltas are not counted as pending any more.
+"""
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from simple_api.redis_client import get_redis_client
+
+PENDING_KEY = 'posts:likes:pending'
+FLUSHING_KEY = 'posts:likes:flushing'
+FLUSH_ID_KEY = 'posts:likes:flush-id'
+FLUSH_LOCK_KEY = 'posts:likes:flush-lock'
+
+
+def is_buffered():
+    return settings.POSTS_LIKES_COUNTER == 'redis'
+
+
+def add_pending_delta(post_id, delta):
+    """
+    Buffer the delta in Redis after the current transaction is committed
+    """
+    transaction.on_commit(lambda: get_redis_client().hincrby(PENDING_KEY, post_id, delta))
+
+
+def get_pending_deltas(post_ids):
+    """
+    Return {post_id: delta} of the likes that are not in the database yet
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    pipe = get_redis_client().pipeline(transaction=False)
+    pipe.hmget(PENDING_KEY, post_ids)
+    pipe.hmget(FLUSHING_KEY, post_ids)
+    pipe.get(FLUSH_ID_KEY)
+    pending, flushing, flush_id = pipe.execute()
+    groups = [pending]
+    if any(value is not None for value in flushing) and not is_flush_applied(flush_id):
+        groups.append(flushing)
+    deltas = {}
+    for values in groups:
+        for post_id, value in zip(post_ids, values):
+            if value is not None:
+                deltas[post_id] = deltas.get(post_id, 0) + int(value)
+    return deltas
+
+
+def merge_pending_likes(posts):
+    """
+    Add the buffered deltas to number_of_likes of the given posts (one Redis round trip)
+    """
+    if not is_buffered():
+        return
+    posts = [post for post in posts if not getattr(post, '_pending_likes_merged', False) and
+             'number_of_likes' not in post.get_deferred_fields()]
+    deltas = get_pending_deltas(post.pk for post in posts)
+    for post in posts:
+        post.number_of_likes += deltas.get(post.pk, 0)
+        post._pending_likes_merged = True
+
+
+def merge_pending_likes_values(rows):
+    """
+    Same as merge_pending_likes() for dicts with id and number_of_likes keys,
+    the id key is there for the rows of the list views even if it is not
+    one of the sparse fields (see ValuesListMixin)
+    """
+    if not is_buffered():
+        return
+    rows = [row for row in rows if 'number_of_likes' in row]
+    deltas = get_pending_deltas(row['id'] for row in rows)
+    for row in rows:
+        row['number_of_likes'] += deltas.get(row['id'], 0)
+
+
+def is_flush_applied(flush_id):
+    from .models import LikesCounterFlush
+
+    if flush_id is None:
+        return False
+    return LikesCounterFlush.objects.filter(flush_id=flush_id.decode('utf-8')).exists()
+
+
+def take_pending_deltas():
+    """
+    Move the pending deltas aside for flushing and return (flush id, {post_id: delta}),
+    (None, {}) if there is nothing to flush.
+    Deltas left by a failed flush are returned again with the same flush id.
+    """
+    client = get_redis_client()
+    if not client.exists(FLUSHING_KEY):
+        if not client.exists(PENDING_KEY):
+            return None, {}
+        pipe = client.pipeline()
+        pipe.renamenx(PENDING_KEY, FLUSHING_KEY)
+        pipe.set(FLUSH_ID_KEY, str(uuid.uuid4()))
+        pipe.execute()
+    # hashes moved aside before flush ids were introduced get one now
+    client.setnx(FLUSH_ID_KEY, str(uuid.uuid4()))
+    flush_id = client.get(FLUSH_ID_KEY).decode('utf-8')
+    return flush_id, {int(post_id): int(delta) for post_id, delta in client.hgetall(FLUSHING_KEY).items()}
+
+
+def mark_flush_applied(flush_id):
+    """
+    Save the flush id in the current transaction, return False if it is already applied
+    """
+    from .models import LikesCounterFlush
+
+    if LikesCounterFlush.objects.filter(flush_id=flush_id).exists():
+        return False
+    LikesCounterFlush.objects.exclude(flush_id=flush_id).delete()
+    LikesCounterFlush.objects.create(flush_id=flush_id)
+    return True
+
+
+def ack_flushed_deltas():
+    pipe = get_redis_client().pipeline()
+    pipe.delete(FLUSHING_KEY)
+    pipe.delete(FLUSH_ID_KEY)
+    pipe.execute()
+
+
+def get_flush_lock():
+    return get_redis_client().lock(FLUSH_LOCK_KEY, timeout=settings.POSTS_LIKES_FLUSH_INTERVAL * 6)
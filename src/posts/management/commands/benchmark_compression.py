@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from posts.models import Post
+from posts.serializers import PostDetailSerializer
+from simple_api.middleware import brotli, brotli_compress, gzip_compress
+from simple_api.renderers import FastJSONRenderer
+
+
+class Command(BaseCommand):
+    """
+    Print the size and the CPU time of the compression levels
+    for the ?likes=1 detail response of the most liked post
+    """
+    help = 'Measure bytes saved and CPU cost of the response compression'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--post-id', type=int, help='Post to render, the most liked one by default')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        if options['post_id']:
+            posts = posts.filter(pk=options['post_id'])
+        post = posts.order_by('-number_of_likes').first()
+        if post is None:
+            raise CommandError('No post to render')
+        request = Request(RequestFactory().get('/', {'likes': '1'}))
+        data = PostDetailSerializer(post, context={'request': request}).data
+        content = FastJSONRenderer().render(data)
+        self.stdout.write('Post %d with %d likes: %d bytes' % (post.pk, post.number_of_likes, len(content)))
+        methods = [('gzip %d' % level, gzip_compress, level) for level in (1, 4, 6, 9)]
+        if brotli is not None:
+            methods += [('br %d' % quality, brotli_compress, quality) for quality in (1, 4, 6, 11)]
+        else:
+            self.stdout.write('brotli is not installed')
+        for name, compress, level in methods:
+            start = time.time()
+            for _ in range(options['repeat']):
+                compressed = compress(content, level)
+            duration = (time.time() - start) * 1000 / options['repeat']
+            self.stdout.write('%-8s %8d bytes (%.1f%% saved) %.2fms' % (
+                name, len(compressed), 100 - len(compressed) * 100.0 / len(content), duration))
@@ -0,0 +1,95 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.models import Like, Post
+from posts.reconciliation import reconcile_likes_counts
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Print the plans and the latencies of the API query shapes,
+    compare the output before and after the index migration on a fresh database:
+    ./manage.py migrate posts 0004 && ./manage.py migrate accounts
+    ./manage.py benchmark_queries --seed 20000
+    ./manage.py migrate posts && ./manage.py benchmark_queries
+    """
+    help = 'Show EXPLAIN and timings of the post and like list queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Create this number of posts (and 10 times more likes) first')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Number of runs of every query')
+        parser.add_argument('--no-explain', action='store_false', dest='explain',
+                            help='Only print the timings')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+        post = Post.objects.order_by('-number_of_likes').first()
+        user = User.objects.order_by('-pk').first()
+        if post is None or user is None:
+            self.stderr.write('No posts to benchmark, run with --seed N')
+            return
+        active_posts = Post.objects.get_active_posts().order_by('-timestamp', '-id')
+        middle = active_posts[active_posts.count() // 2:].first() or post
+        queries = [
+            ('post list count', active_posts.order_by().values('pk'), 'count'),
+            ('post list page', active_posts[100:120], 'list'),
+            ('post list cursor page', active_posts.filter(timestamp__lte=middle.timestamp)[:20], 'list'),
+            ('likes of a post', Like.objects.filter(post_id=post.pk).order_by('-timestamp', '-id')[:20], 'list'),
+            ('likes of a user', Like.objects.filter(user_id=user.pk).order_by('-timestamp', '-id')[:20], 'list'),
+        ]
+        for name, queryset, method in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if options['explain']:
+                for line in self.explain(queryset.query):
+                    self.stdout.write('  %s' % line)
+            timings = self.measure(queryset, method, options['repeat'])
+            self.stdout.write('  median %.2fms, max %.2fms' % (timings[len(timings) // 2], timings[-1]))
+
+    def seed(self, number_of_posts):
+        number_of_users = max(number_of_posts // 10, 10)
+        first_id = (User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                User(email='benchmark%d@example.com' % (first_id + i), first_name='Benchmark', last_name='User')
+                for i in range(number_of_users)
+            )
+            user_ids = list(User.objects.filter(email__in=[user.email for user in users]).values_list('pk', flat=True))
+            Post.objects.bulk_create(
+                (Post(user_id=random.choice(user_ids), title='Post %d' % i, content='Benchmark post',
+                      is_published=random.random() > 0.1)
+                 for i in range(number_of_posts))
+            )
+            post_ids = list(Post.objects.filter(user_id__in=user_ids).values_list('pk', flat=True))
+            pairs = set()
+            for _ in range(number_of_posts * 10):
+                pairs.add((random.choice(post_ids), random.choice(user_ids)))
+            Like.objects.bulk_create(Like(post_id=post_id, user_id=user_id) for post_id, user_id in pairs)
+        reconcile_likes_counts()
+        self.stdout.write('Created %d users, %d posts, %d likes' % (len(user_ids), len(post_ids), len(pairs)))
+
+    def explain(self, query):
+        sql, params = query.sql_with_params()
+        prefix = 'EXPLAIN ANALYZE ' if connection.vendor == 'postgresql' else 'EXPLAIN QUERY PLAN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+    def measure(self, queryset, method, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.time()
+            if method == 'count':
+                queryset.count()
+            else:
+                list(queryset.all())
+            timings.append((time.time() - start) * 1000)
+        return sorted(timings)
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from posts.models import Like, Post
+from posts.serializers import LikeListSerializer, PostListSerializer
+from simple_api.query_plans import plan_queryset
+from simple_api.renderers import FastJSONRenderer
+from simple_api.values_serialization import compile_row_serializer
+
+
+class Command(BaseCommand):
+    """
+    Compare rendering a page with the serializers and JSONRenderer
+    against the values() rows and FastJSONRenderer of the list views
+    """
+    help = 'Benchmark the serializer and the values() paths of the list endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Number of renders of every page')
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        pages = [
+            ('post list', PostListSerializer, Post.objects.get_active_posts().order_by('-timestamp', '-id')),
+            ('like list', LikeListSerializer, Like.objects.order_by('-timestamp', '-id')),
+        ]
+        for name, serializer_class, queryset in pages:
+            serializer = serializer_class(many=True)
+            queryset = plan_queryset(queryset, serializer)
+            row_serializer = compile_row_serializer(serializer)
+            instances = list(queryset[:page_size])
+            rows = list(queryset.values(*row_serializer.paths)[:page_size])
+            if not rows:
+                raise CommandError('No rows for the %s, create some data first' % name)
+
+            def render_serializer():
+                return JSONRenderer().render(serializer_class(instances, many=True).data)
+
+            def render_values():
+                return FastJSONRenderer().render([row_serializer.to_representation(row) for row in rows])
+
+            if render_serializer() != render_values():
+                raise CommandError('The %s outputs differ' % name)
+            slow = self.measure(render_serializer, options['repeat'])
+            fast = self.measure(render_values, options['repeat'])
+            self.stdout.write('%s (%d items): serializer %.3fms, values %.3fms, %.1fx' % (
+                name, len(rows), slow, fast, slow / fast))
+
+    def measure(self, render, repeat):
+        start = time.time()
+        for _ in range(repeat):
+            render()
+        return (time.time() - start) * 1000 / repeat
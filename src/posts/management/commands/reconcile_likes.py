@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.reconciliation import reconcile_likes_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute number_of_likes of posts from the Like table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of posts checked by one query')
+
+    def handle(self, *args, **options):
+        result = reconcile_likes_counts(chunk_size=options['chunk_size'])
+        self.stdout.write('Checked %d posts, fixed %d in %.2fs' % result)
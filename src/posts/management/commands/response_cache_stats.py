@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.response_cache import get_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hits and misses of the post responses cache'
+
+    def handle(self, *args, **options):
+        stats = get_stats(['PostListAPIView', 'PostDetailAPIView'])
+        for view_name, counts in sorted(stats.items()):
+            total = counts['hits'] + counts['misses']
+            ratio = counts['hits'] * 100.0 / total if total else 0
+            self.stdout.write('%s: %d hits, %d misses (%.1f%%)' % (
+                view_name, counts['hits'], counts['misses'], ratio))
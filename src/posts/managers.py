@@ -1,6 +1,146 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import counters
+from .response_cache import invalidate_post_list_responses, invalidate_post_responses
+from .search import index_posts, remove_posts
 
 
 class PostManager(models.Manager):
+    """
+    Posts which are not waiting for deletion, Post._base_manager sees all of them
+    """
+    def get_queryset(self):
+        return super(PostManager, self).get_queryset().filter(is_deleted=False)
+
     def get_active_posts(self):
         return self.filter(is_published=True)
+
+    def change_likes_count(self, post_id, delta):
+        """
+        Atomically add delta to the number of likes of the post,
+        or buffer it in Redis if the write-behind counter is enabled.
+        Returns the number of changed posts (0 if the post does not exist).
+        """
+        if counters.is_buffered():
+            if not self.filter(pk=post_id).exists():
+                return 0
+            counters.add_pending_delta(post_id, delta)
+            return 1
+        return self.filter(pk=post_id).update(
+            number_of_likes=F('number_of_likes') + delta,
+            updated=timezone.now()
+        )
+
+    def create_many(self, posts):
+        """
+        Insert the posts in one transaction and return them with their ids.
+        bulk_create sends no signals, so the search index and the cached
+        list responses are updated here. On the databases which do not return
+        the ids of a bulk insert (SQLite) the posts are saved one by one.
+        """
+        with transaction.atomic(using=self.db):
+            if not connections[self.db].features.can_return_ids_from_bulk_insert:
+                for post in posts:
+                    post.save(using=self.db)
+                return posts
+            posts = self.bulk_create(posts)
+            index_posts([post.pk for post in posts])
+            invalidate_post_list_responses()
+        return posts
+
+    def delete_post(self, post):
+        """
+        Delete the post with its likes. The likes are deleted in bulk without
+        the post_delete signals, which would update the counter of the post
+        being deleted for every like. In 'async' POSTS_DELETE_MODE the post is
+        only hidden here and purge_post() is run by a Celery task.
+        """
+        if settings.POSTS_DELETE_MODE != 'async':
+            return self.purge_post(post.pk)
+        from .tasks import purge_post
+
+        with transaction.atomic(using=self.db):
+            self.filter(pk=post.pk).update(is_deleted=True)
+            remove_posts([post.pk])
+            invalidate_post_responses(post.pk)
+            transaction.on_commit(lambda: purge_post.delay(post.pk))
+
+    def purge_post(self, post_id, chunk_size=None):
+        """
+        Delete the likes of the post (by chunks in separate transactions if
+        chunk_size is given) and then the post itself
+        """
+        likes = self.model._meta.get_field('likes').related_model.objects.filter(post_id=post_id)
+        if chunk_size is None:
+            with transaction.atomic(using=self.db):
+                likes._raw_delete(self.db)
+                self._delete_post(post_id)
+            return
+        while True:
+            with transaction.atomic(using=self.db):
+                ids = list(likes.values_list('pk', flat=True)[:chunk_size])
+                if not ids:
+                    self._delete_post(post_id)
+                    return
+                likes.model.objects.filter(pk__in=ids)._raw_delete(self.db)
+
+    def _delete_post(self, post_id):
+        post = self.model._base_manager.using(self.db).filter(pk=post_id).first()
+        if post is not None:
+            post.delete()
+
+    def apply_likes_deltas(self, deltas):
+        """
+        Add {post_id: delta} to the number of likes of the posts in a single query
+        """
+        if not deltas:
+            return 0
+        whens = [When(pk=post_id, then=Value(delta)) for post_id, delta in deltas.items()]
+        return self.filter(pk__in=deltas.keys()).update(
+            number_of_likes=F('number_of_likes') + Case(*whens, default=Value(0), output_field=IntegerField()),
+            updated=timezone.now()
+        )
+
+
+class LikeManager(models.Manager):
+    def toggle(self, user_id, post_id):
+        """
+        Like the post if the user has not liked it yet, otherwise remove the like.
+        The like row and the post counter are changed in one transaction
+        without the post_save/post_delete signals.
+        Returns True if the post is liked after the call, raises
+        Post.DoesNotExist if there is no such post.
+        """
+        post_model = self.model._meta.get_field('post').related_model
+        with transaction.atomic(using=self.db):
+            liked = not self._delete_like(user_id, post_id)
+            if liked:
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.bulk_create([self.model(user_id=user_id, post_id=post_id)])
+                except IntegrityError:
+                    # concurrent request (e.g. double click) has liked the post
+                    # first, so this one works as the second click
+                    liked = not self._delete_like(user_id, post_id)
+            if not post_model.objects.change_likes_count(post_id, 1 if liked else -1):
+                raise post_model.DoesNotExist
+            invalidate_post_responses(post_id)
+        return liked
+
+    def get_liked_post_ids(self, user_id, post_ids):
+        """
+        Return the set of the posts (of the given ones) liked by the user
+        """
+        if not post_ids:
+            return set()
+        return set(self.filter(user_id=user_id, post_id__in=post_ids).values_list('post_id', flat=True))
+
+    def _delete_like(self, user_id, post_id):
+        """
+        Delete the like in a single query without sending signals.
+        Returns the number of deleted rows.
+        """
+        return self.filter(user_id=user_id, post_id=post_id)._raw_delete(self.db)
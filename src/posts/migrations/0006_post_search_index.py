@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+CREATE_SQL = {
+    'postgresql': [
+        'CREATE TABLE posts_post_search ('
+        'post_id integer PRIMARY KEY REFERENCES posts_post (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+        'document tsvector NOT NULL)',
+        'CREATE INDEX posts_post_search_document_idx ON posts_post_search USING GIN (document)',
+        'INSERT INTO posts_post_search (post_id, document) '
+        "SELECT id, setweight(to_tsvector('english', title), 'A') || "
+        "setweight(to_tsvector('english', content), 'B') FROM posts_post",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE posts_post_search USING fts5(title, content, tokenize='porter unicode61')",
+        'INSERT INTO posts_post_search (rowid, title, content) SELECT id, title, content FROM posts_post',
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute('DROP TABLE posts_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_api_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
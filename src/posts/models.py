@@ -2,8 +2,16 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.db.models.signals import post_save, post_delete
 
-from .managers import PostManager
-from .signals_handlers import post_likes_decrement, post_likes_increment
+from .managers import LikeManager, PostManager
+from .signals_handlers import (
+    like_responses_invalidate,
+    post_likes_decrement,
+    post_likes_increment,
+    post_responses_invalidate,
+    post_search_index_remove,
+    post_search_index_update,
+    user_responses_invalidate
+)
 
 User = get_user_model()
 
@@ -14,17 +22,25 @@ class Post(models.Model):
     content = models.TextField(blank=True)
     number_of_likes = models.IntegerField(default=0)
     is_published = models.BooleanField(default=True)
+    # hidden until a Celery task deletes the post (POSTS_DELETE_MODE = 'async')
+    is_deleted = models.BooleanField(default=False)
     updated = models.DateTimeField(auto_now=True, auto_now_add=False)
     timestamp = models.DateTimeField(auto_now=False, auto_now_add=True)
     objects = PostManager()
 
+    class Meta:
+        indexes = [
+            # published posts, newest first
+            models.Index(fields=['is_published', '-timestamp', '-id']),
+        ]
+
     def increment_likes(self):
+        Post.objects.change_likes_count(self.pk, 1)
         self.number_of_likes += 1
-        self.save()
 
     def decrement_likes(self):
+        Post.objects.change_likes_count(self.pk, -1)
         self.number_of_likes -= 1
-        self.save()
 
     def get_users_who_liked(self):
         return User.objects.filter(likes__in=self.likes.values_list('id', flat=True))
@@ -34,15 +50,42 @@ class Post(models.Model):
 
 
 class Like(models.Model):
-    user = models.ForeignKey(User, related_name='likes')
-    post = models.ForeignKey(Post, related_name='likes')
+    # indexed by the composite indexes below
+    user = models.ForeignKey(User, related_name='likes', db_index=False)
+    post = models.ForeignKey(Post, related_name='likes', db_index=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    objects = LikeManager()
 
     class Meta:
         unique_together = ('post', 'user')
+        indexes = [
+            # likes of a post, newest first
+            models.Index(fields=['post', '-timestamp', '-id']),
+            # likes of a user, newest first
+            models.Index(fields=['user', '-timestamp', '-id']),
+            # likes of an hour, counted by posts.trending
+            models.Index(fields=['timestamp']),
+        ]
+
+
+class LikesCounterFlush(models.Model):
+    """
+    The last flush of the Redis likes counters (see posts.counters), saved in the
+    transaction which applies it, so a flush retried after a crash is not applied twice
+    """
+    flush_id = models.CharField(max_length=36, unique=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
 
 
 post_save.connect(post_likes_increment, sender=Like)
 
 
 post_delete.connect(post_likes_decrement, sender=Like)
+
+post_save.connect(like_responses_invalidate, sender=Like)
+post_delete.connect(like_responses_invalidate, sender=Like)
+post_save.connect(post_responses_invalidate, sender=Post)
+post_delete.connect(post_responses_invalidate, sender=Post)
+post_save.connect(post_search_index_update, sender=Post)
+post_delete.connect(post_search_index_remove, sender=Post)
+post_save.connect(user_responses_invalidate, sender=User)
@@ -1,6 +1,279 @@
-from rest_framework.pagination import LimitOffsetPagination
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomLimitOffsetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination with a configurable count (count_mode attribute of the view):
+    'exact' - COUNT(*) on every page,
+    'none' - no count, only next/previous links,
+    'cached' - COUNT(*) cached for count_cache_timeout seconds,
+    'estimated' - row estimate of the PostgreSQL planner (exact count on other
+    databases and for the estimates below estimated_count_threshold).
+    Except 'exact' mode the response has count_exact flag.
+    """
     default_limit = 20
     max_limit = 20
+    count_mode = 'exact'
+    count_cache_timeout = 60
+    estimated_count_threshold = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = getattr(view, 'count_mode', self.count_mode)
+        if self.count_mode == 'exact':
+            return super(CustomLimitOffsetPagination, self).paginate_queryset(queryset, request, view)
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        if self.count_mode == 'none':
+            self.count, self.count_exact = None, False
+        elif self.count_mode == 'cached':
+            self.count, self.count_exact = self.get_cached_count(queryset)
+        elif self.count_mode == 'estimated':
+            self.count, self.count_exact = self.get_estimated_count(queryset)
+        else:
+            raise ValueError('Unknown count mode: %s' % self.count_mode)
+        # the count may be stale, so the next link is found by one extra row
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        return results[:self.limit]
+
+    def get_paginated_response(self, data):
+        if self.count_mode == 'exact':
+            return super(CustomLimitOffsetPagination, self).get_paginated_response(data)
+        response_data = OrderedDict()
+        if self.count is not None:
+            response_data['count'] = self.count
+        response_data['count_exact'] = self.count_exact
+        response_data['next'] = self.get_next_link()
+        response_data['previous'] = self.get_previous_link()
+        response_data['results'] = data
+        return Response(response_data)
+
+    def get_next_link(self):
+        if self.count_mode == 'exact':
+            return super(CustomLimitOffsetPagination, self).get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_cached_count(self, queryset):
+        """
+        Return (count, exact), the count is cached by the SQL of the query
+        """
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return 0, True
+        key = 'pagination:count:%s' % hashlib.md5(sql.encode('utf-8')).hexdigest()
+        count = cache.get(key)
+        if count is not None:
+            return count, False
+        count = queryset.count()
+        cache.set(key, count, self.count_cache_timeout)
+        return count, True
+
+    def get_estimated_count(self, queryset):
+        """
+        Return (count, exact), the count is estimated by EXPLAIN on PostgreSQL
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return queryset.count(), True
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0, True
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate < self.estimated_count_threshold:
+            return queryset.count(), True
+        return estimate, False
+
+
+class TimestampCursorPagination(BasePagination):
+    """
+    Keyset pagination on (timestamp, id), newest first.
+    A page is fetched with WHERE (timestamp, id) < cursor, so it costs the same
+    on any depth and is not shifted by the rows inserted meanwhile.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 20
+    max_limit = 20
+    ordering = ('timestamp', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_limit(request)
+        reverse, position = self.decode_cursor(request)
+        timestamp_field, id_field = self.ordering
+        if reverse:
+            ordering = (timestamp_field, id_field)
+            lookup = '__gt'
+        else:
+            ordering = ('-' + timestamp_field, '-' + id_field)
+            lookup = '__lt'
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            timestamp, pk = position
+            queryset = queryset.filter(
+                Q(**{timestamp_field + lookup: timestamp}) |
+                Q(**{timestamp_field: timestamp, id_field + lookup: pk})
+            )
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        if limit <= 0:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(True, self.page[0])
+
+    def decode_cursor(self, request):
+        """
+        Return (reverse, (timestamp, id)) from the cursor query param
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+        try:
+            direction, timestamp, pk = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            timestamp = parse_datetime(timestamp)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None or direction not in ('n', 'p'):
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'p', (timestamp, pk)
+
+    def encode_cursor(self, reverse, item):
+        timestamp, pk = self.get_position(item)
+        cursor = '%s|%s|%d' % ('p' if reverse else 'n', timestamp.isoformat(), pk)
+        encoded = urlsafe_b64encode(cursor.encode('ascii')).decode('ascii')
+        url = replace_query_param(self.base_url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return tuple(item[field] for field in self.ordering)
+        return tuple(getattr(item, field) for field in self.ordering)
+
+
+class RankCursorPagination(TimestampCursorPagination):
+    """
+    Keyset pagination on (rank, id), best first, of the results
+    with page(limit, position, reverse) method (e.g. posts.search.SearchResults)
+    """
+    ordering = ('search_rank', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_limit(request)
+        reverse, position = self.decode_cursor(request)
+        results = queryset.page(self.limit + 1, position, reverse)
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def decode_cursor(self, request):
+        """
+        Return (reverse, (rank, id)) from the cursor query param,
+        the rank is kept as a string and parsed by the search backend
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+        try:
+            direction, rank, pk = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            float(rank)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('n', 'p'):
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'p', (rank, pk)
+
+    def encode_cursor(self, reverse, item):
+        rank, pk = self.get_position(item)
+        cursor = '%s|%s|%d' % ('p' if reverse else 'n', rank, pk)
+        encoded = urlsafe_b64encode(cursor.encode('ascii')).decode('ascii')
+        url = replace_query_param(self.base_url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+
+class PaginationModeMixin(object):
+    """
+    Choose the paginator with the ?pagination= query param,
+    e.g. ?pagination=cursor for the keyset pagination.
+    """
+    pagination_query_param = 'pagination'
+    pagination_modes = {
+        'offset': CustomLimitOffsetPagination,
+        'cursor': TimestampCursorPagination,
+    }
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            mode = self.request.query_params.get(self.pagination_query_param)
+            pagination_class = self.pagination_modes.get(mode, self.pagination_class)
+            self._paginator = pagination_class() if pagination_class is not None else None
+        return self._paginator
@@ -0,0 +1,59 @@
+"""
+Repair of Post.number_of_likes drifted from the Like table
+(bulk deletes, admin edits, raw SQL, failed requests).
+"""
+import time
+from collections import namedtuple
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import counters
+from .models import Post, Like
+from .response_cache import invalidate_post_responses
+
+ReconciliationResult = namedtuple('ReconciliationResult', ['checked', 'fixed', 'duration'])
+
+
+def get_likes_drift(posts):
+    """
+    Return {post_id: actual - stored} for the posts whose counter is wrong.
+    posts - rows of (id, number_of_likes, actual number of likes)
+    """
+    pending = counters.get_pending_deltas(post_id for post_id, _, _ in posts) if counters.is_buffered() else {}
+    drift = {}
+    for post_id, number_of_likes, actual in posts:
+        delta = actual - number_of_likes - pending.get(post_id, 0)
+        if delta:
+            drift[post_id] = delta
+    return drift
+
+
+def reconcile_likes_counts(chunk_size=1000):
+    """
+    Recompute number_of_likes in chunks of posts ordered by primary key.
+    Every chunk is read with one query (the likes are counted by a correlated subquery
+    on the post_id index, so the counter and the count come from the same snapshot)
+    and only the drifted posts are updated, relatively to the current value,
+    so concurrent likes are not lost.
+    """
+    started = time.time()
+    likes_count = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+        count=Count('pk')).values('count')
+    queryset = Post.objects.order_by('pk').annotate(
+        actual=Coalesce(Subquery(likes_count, output_field=IntegerField()), 0))
+    checked = fixed = 0
+    last_id = 0
+    while True:
+        posts = list(queryset.filter(pk__gt=last_id).values_list('pk', 'number_of_likes', 'actual')[:chunk_size])
+        if not posts:
+            break
+        drift = get_likes_drift(posts)
+        if drift:
+            Post.objects.apply_likes_deltas(drift)
+            for post_id in drift:
+                invalidate_post_responses(post_id)
+        checked += len(posts)
+        fixed += len(drift)
+        last_id = posts[-1][0]
+    return ReconciliationResult(checked, fixed, time.time() - started)
@@ -0,0 +1,145 @@
+"""
+Cache of the serialized post list and detail responses for anonymous readers.
+A cache key contains the version of the posts list or of the post,
+Post and Like changes bump the versions (see posts.signals_handlers).
+The keys also contain the version of the users, changed by the saves of
+the user fields shown in the responses (the post author, the liking users).
+"""
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import urlencode
+from rest_framework.response import Response
+
+LIST_VERSION_KEY = 'posts:responses:version:list'
+POST_VERSION_KEY = 'posts:responses:version:post:%s'
+# the time of the last change in milliseconds
+USERS_VERSION_KEY = 'posts:responses:version:users'
+RESPONSE_KEY = 'posts:responses:%s:%s:%s'
+STATS_KEY = 'posts:responses:stats:%s:%s'
+
+
+def _new_version():
+    # not reused when a version key is evicted
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def invalidate_post_responses(post_id):
+    """
+    Drop the cached responses with the post (the detail and all list pages).
+    The versions are bumped again after the commit, so a response cached from
+    the old data by a concurrent request is not used either.
+    """
+    def bump():
+        bump_version(POST_VERSION_KEY % post_id)
+        bump_version(LIST_VERSION_KEY)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def get_users_changed():
+    """
+    Return the users version and the datetime of the last change of the users
+    """
+    version = get_version(USERS_VERSION_KEY)
+    return version, datetime.datetime.fromtimestamp(version / 1000.0, datetime.timezone.utc)
+
+
+def invalidate_user_responses():
+    """
+    Drop the cached responses with the users, they are rarely changed
+    so all the responses are dropped
+    """
+    def bump():
+        cache.set(USERS_VERSION_KEY, _new_version(), None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def invalidate_post_list_responses():
+    """
+    Drop the cached list pages, e.g. after new posts are inserted without signals
+    """
+    bump_version(LIST_VERSION_KEY)
+    transaction.on_commit(lambda: bump_version(LIST_VERSION_KEY))
+
+
+def count_request(view_name, result):
+    key = STATS_KEY % (view_name, result)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_stats(view_names):
+    """
+    Return {view_name: {'hits': n, 'misses': n}}
+    """
+    keys = [STATS_KEY % (view_name, result) for view_name in view_names for result in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    return {
+        view_name: {result: values.get(STATS_KEY % (view_name, result), 0) for result in ('hits', 'misses')}
+        for view_name in view_names
+    }
+
+
+class ResponseCacheMixin(object):
+    """
+    Cache the data of the GET responses of anonymous users.
+    Set cache_responses = False to disable the cache for the view.
+    """
+    cache_responses = True
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_response_cached(request):
+            return super(ResponseCacheMixin, self).get(request, *args, **kwargs)
+        view_name = self.__class__.__name__
+        key = self.get_response_cache_key(request, **kwargs)
+        data = cache.get(key)
+        if data is not None:
+            count_request(view_name, 'hits')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = super(ResponseCacheMixin, self).get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.POSTS_RESPONSE_CACHE_TIMEOUT)
+        count_request(view_name, 'misses')
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def is_response_cached(self, request):
+        return (self.cache_responses and settings.POSTS_RESPONSE_CACHE_TIMEOUT and
+                not request.user.is_authenticated)
+
+    def get_response_cache_key(self, request, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        version = '%s.%s' % (get_version(POST_VERSION_KEY % pk if pk else LIST_VERSION_KEY),
+                             get_version(USERS_VERSION_KEY))
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        show_likes = request.query_params.get('likes') == '1'
+        path = '%s?%s&likes=%d' % (request.path, query, show_likes)
+        return RESPONSE_KEY % (self.__class__.__name__, version, hashlib.md5(path.encode('utf-8')).hexdigest())
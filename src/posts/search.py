@@ -0,0 +1,154 @@
+"""
+Full-text search over the title and the content of posts.
+The search index is the posts_post_search table (created by the 0006 migration):
+a tsvector column with a GIN index on PostgreSQL, an FTS5 table on SQLite.
+It is updated by the Post signals, so it is changed in the transaction of the post.
+Results are ordered by (rank, id), the rank is rounded to a fixed precision
+so it can be compared with the rank of a cursor.
+"""
+import re
+from decimal import Decimal
+
+from django.db import connection
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+RANK_PRECISION = 6
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class PostgreSQLBackend(object):
+    index_sql = (
+        'INSERT INTO posts_post_search (post_id, document) '
+        "SELECT id, setweight(to_tsvector('english', title), 'A') || "
+        "setweight(to_tsvector('english', content), 'B') "
+        'FROM posts_post WHERE id IN (%s) '
+        'ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document'
+    )
+    remove_sql = 'DELETE FROM posts_post_search WHERE post_id IN (%s)'
+    search_sql = (
+        'SELECT id, rank FROM ('
+        'SELECT s.post_id AS id, ROUND(ts_rank(s.document, query)::numeric, %d) AS rank '
+        'FROM posts_post_search s JOIN posts_post p ON p.id = s.post_id, '
+        "plainto_tsquery('english', %%s) query "
+        'WHERE s.document @@ query AND p.is_published'
+        ') ranked'
+    ) % RANK_PRECISION
+
+    def get_query(self, text):
+        return text
+
+    def parse_rank(self, rank):
+        return Decimal(rank)
+
+
+class SQLiteBackend(object):
+    index_sql = (
+        'INSERT INTO posts_post_search (rowid, title, content) '
+        'SELECT id, title, content FROM posts_post WHERE id IN (%s)'
+    )
+    remove_sql = 'DELETE FROM posts_post_search WHERE rowid IN (%s)'
+    # bm25 is lower for better matches, the title is weighted twice
+    search_sql = (
+        'SELECT id, rank FROM ('
+        'SELECT posts_post_search.rowid AS id, ROUND(-bm25(posts_post_search, 2.0, 1.0), %d) AS rank '
+        'FROM posts_post_search JOIN posts_post p ON p.id = posts_post_search.rowid '
+        'WHERE posts_post_search MATCH %%s AND p.is_published'
+        ') ranked'
+    ) % RANK_PRECISION
+
+    def get_query(self, text):
+        # every word is quoted, so the FTS5 query syntax is not exposed
+        return ' '.join('"%s"' % word for word in WORD_RE.findall(text))
+
+    def parse_rank(self, rank):
+        return float(rank)
+
+
+class SearchNotSupported(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = 'Search is not supported by the database.'
+    default_code = 'search_not_supported'
+
+
+BACKENDS = {
+    'postgresql': PostgreSQLBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def get_backend():
+    backend_class = BACKENDS.get(connection.vendor)
+    return backend_class() if backend_class is not None else None
+
+
+def _execute_for_ids(sql, post_ids):
+    if not post_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(sql % ', '.join(['%s'] * len(post_ids)), list(post_ids))
+
+
+def index_posts(post_ids):
+    """
+    Add the posts to the search index or update their documents
+    """
+    backend = get_backend()
+    if backend is None:
+        return
+    if isinstance(backend, SQLiteBackend):
+        # FTS5 tables have no upsert
+        _execute_for_ids(backend.remove_sql, post_ids)
+    _execute_for_ids(backend.index_sql, post_ids)
+
+
+def remove_posts(post_ids):
+    backend = get_backend()
+    if backend is not None:
+        _execute_for_ids(backend.remove_sql, post_ids)
+
+
+def search_post_ids(text, limit, position=None, reverse=False):
+    """
+    Return [(post id, rank)] of the published posts matching the text,
+    best first (worst first if reverse) after the (rank, id) position
+    """
+    backend = get_backend()
+    if backend is None:
+        raise SearchNotSupported('Search is not supported on %s.' % connection.vendor)
+    if not WORD_RE.search(text):
+        return []
+    sql = backend.search_sql
+    params = [backend.get_query(text)]
+    if position is not None:
+        rank, post_id = position
+        rank = backend.parse_rank(rank)
+        operator = '>' if reverse else '<'
+        sql += ' WHERE rank %s %%s OR (rank = %%s AND id %s %%s)' % (operator, operator)
+        params.extend([rank, rank, post_id])
+    sql += ' ORDER BY rank %s, id %s LIMIT %%s' % (('ASC', 'ASC') if reverse else ('DESC', 'DESC'))
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(post_id, rank) for post_id, rank in cursor.fetchall()]
+
+
+class SearchResults(object):
+    """
+    Search results for the RankCursorPagination, the posts are taken from the
+    queryset and have search_rank attribute
+    """
+    def __init__(self, text, queryset):
+        self.text = text
+        self.queryset = queryset
+
+    def page(self, limit, position=None, reverse=False):
+        rows = search_post_ids(self.text, limit, position, reverse)
+        posts = self.queryset.in_bulk([post_id for post_id, _ in rows])
+        results = []
+        for post_id, rank in rows:
+            post = posts.get(post_id)
+            if post is not None:
+                post.search_rank = rank
+                results.append(post)
+        return results
@@ -1,17 +1,97 @@
 from rest_framework.serializers import (
+    ListSerializer,
     ModelSerializer,
-    SerializerMethodField
+    ReadOnlyField
 )
 
 from accounts.serializers import UserDetailSerializer
-from posts.models import Post
+from posts.counters import merge_pending_likes, merge_pending_likes_values
+from posts.models import Post, Like
+from simple_api.sparse_fieldsets import SparseFieldsetMixin
+
+
+class PendingLikesListSerializer(ListSerializer):
+    """
+    Merge the likes buffered in Redis for the whole page at once
+    """
+    def to_representation(self, data):
+        iterable = data.all() if hasattr(data, 'all') else data
+        merge_pending_likes(iterable)
+        return super(PendingLikesListSerializer, self).to_representation(iterable)
+
+    def to_representation_values(self, data):
+        merge_pending_likes_values(data)
+        return data
+
+
+class PendingLikesMixin(object):
+    """
+    Serialize number_of_likes with the likes which are not flushed to the database yet
+    """
+    def to_representation(self, instance):
+        merge_pending_likes([instance])
+        return super(PendingLikesMixin, self).to_representation(instance)
+
+
+def get_liking_user(serializer):
+    """
+    Return the authenticated user of the request if liked_by_me is shown
+    """
+    request = serializer.context.get('request')
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    fieldset = serializer.sparse_fieldset
+    if fieldset is not None and 'liked_by_me' not in fieldset:
+        return None
+    return user
+
+
+class LikedByMeListSerializer(PendingLikesListSerializer):
+    """
+    Look up the likes of the user for the whole page with one query,
+    the ids of the liked posts are passed to the child in the context
+    """
+    def to_representation(self, data):
+        iterable = list(data.all() if hasattr(data, 'all') else data)
+        user = get_liking_user(self.child)
+        if user is not None:
+            self.context['liked_post_ids'] = Like.objects.get_liked_post_ids(
+                user.pk, [post.pk for post in iterable])
+        return super(LikedByMeListSerializer, self).to_representation(iterable)
+
+    def to_representation_values(self, data):
+        data = super(LikedByMeListSerializer, self).to_representation_values(data)
+        user = get_liking_user(self.child)
+        if user is not None:
+            liked = Like.objects.get_liked_post_ids(user.pk, [item['id'] for item in data])
+            for item in data:
+                item['liked_by_me'] = item['id'] in liked
+        return data
+
+
+class LikedByMeMixin(object):
+    """
+    Add liked_by_me of the authenticated user as the last field
+    """
+    computed_fields = ('liked_by_me', )
+
+    def to_representation(self, instance):
+        ret = super(LikedByMeMixin, self).to_representation(instance)
+        user = get_liking_user(self)
+        if user is not None:
+            liked = self.context.get('liked_post_ids')
+            if liked is None:
+                liked = Like.objects.get_liked_post_ids(user.pk, [instance.pk])
+            ret['liked_by_me'] = instance.pk in liked
+        return ret
 
 
 class LikeListSerializer(ModelSerializer):
     user = UserDetailSerializer()
 
     class Meta:
-        model = Post
+        model = Like
         fields = [
             'id',
             'user',
@@ -32,7 +112,7 @@ class PostCreateUpdateSerializer(ModelSerializer):
                         }
 
 
-class PostDetailSerializer(ModelSerializer):
+class PostDetailSerializer(LikedByMeMixin, SparseFieldsetMixin, PendingLikesMixin, ModelSerializer):
     user = UserDetailSerializer(read_only=True)
     likes = LikeListSerializer(many=True, read_only=True)
 
@@ -49,17 +129,17 @@ class PostDetailSerializer(ModelSerializer):
             'updated',
             'timestamp'
         ]
+        list_serializer_class = LikedByMeListSerializer
 
     def __init__(self, *args, **kwargs):
-        fields = kwargs.pop('fields', None)
         super(PostDetailSerializer, self).__init__(*args, **kwargs)
         show_who_liked = self.context['request'].GET.get('likes')
         if not show_who_liked == '1':
-            self.fields.pop('likes')
+            self.fields.pop('likes', None)
 
 
-class PostListSerializer(ModelSerializer):
-    user_id = SerializerMethodField()
+class PostListSerializer(LikedByMeMixin, SparseFieldsetMixin, PendingLikesMixin, ModelSerializer):
+    user_id = ReadOnlyField()
 
     class Meta:
         model = Post
@@ -70,6 +150,4 @@ class PostListSerializer(ModelSerializer):
             'is_published',
             'user_id'
         ]
-
-    def get_user_id(self, obj):
-        return obj.user.id
+        list_serializer_class = LikedByMeListSerializer
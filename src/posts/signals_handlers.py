@@ -1,6 +1,35 @@
+from accounts.serializers import UserDetailSerializer
+
+from .response_cache import invalidate_post_responses, invalidate_user_responses
+from .search import index_posts, remove_posts
+
+
 def post_likes_increment(sender, instance, **kwargs):
     instance.post.increment_likes()
 
 
 def post_likes_decrement(sender, instance, **kwargs):
     instance.post.decrement_likes()
+
+
+def post_responses_invalidate(sender, instance, **kwargs):
+    invalidate_post_responses(instance.pk)
+
+
+def like_responses_invalidate(sender, instance, **kwargs):
+    invalidate_post_responses(instance.post_id)
+
+
+def user_responses_invalidate(sender, instance, update_fields=None, **kwargs):
+    # e.g. the last_login updates don't change the responses
+    if update_fields is not None and not set(update_fields) & set(UserDetailSerializer.Meta.fields):
+        return
+    invalidate_user_responses()
+
+
+def post_search_index_update(sender, instance, **kwargs):
+    index_posts([instance.pk])
+
+
+def post_search_index_remove(sender, instance, **kwargs):
+    remove_posts([instance.pk])
@@ -0,0 +1,67 @@
+import logging
+
+from celery import shared_task
+from django.db import transaction
+
+from . import counters
+from .models import Post
+from .reconciliation import reconcile_likes_counts
+from .trending import count_likes, rebuild_rankings
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_likes_counters(batch_size=500):
+    """
+    Apply the like deltas buffered in Redis to posts_post.
+    Returns the number of flushed posts.
+    """
+    if not counters.is_buffered():
+        return 0
+    lock = counters.get_flush_lock()
+    if not lock.acquire(blocking=False):
+        return 0
+    try:
+        flush_id, deltas = counters.take_pending_deltas()
+        if flush_id is None:
+            return 0
+        items = [(post_id, delta) for post_id, delta in deltas.items() if delta]
+        with transaction.atomic():
+            # a flush retried after a crash between the commit and the ack is skipped
+            if not counters.mark_flush_applied(flush_id):
+                items = []
+            for i in range(0, len(items), batch_size):
+                Post.objects.apply_likes_deltas(dict(items[i:i + batch_size]))
+        counters.ack_flushed_deltas()
+    finally:
+        lock.release()
+    return len(items)
+
+
+@shared_task
+def reconcile_likes(chunk_size=1000):
+    """
+    Repair number_of_likes drifted from the Like table
+    """
+    result = reconcile_likes_counts(chunk_size=chunk_size)
+    logger.info('Checked %d posts, fixed %d in %.2fs', *result)
+    return result._asdict()
+
+
+@shared_task
+def refresh_trending_posts():
+    """
+    Count the likes and rebuild the trending rankings
+    """
+    counted = count_likes()
+    rebuild_rankings()
+    return counted
+
+
+@shared_task
+def purge_post(post_id, chunk_size=1000):
+    """
+    Delete the post hidden by PostManager.delete_post() and its likes
+    """
+    Post.objects.purge_post(post_id, chunk_size=chunk_size)
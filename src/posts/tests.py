@@ -1,13 +1,33 @@
+import gzip
 import json
+import time
+from io import StringIO
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import connection, reset_queries
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 
 from mixer.backend.django import mixer
+from mock import MagicMock, patch
 
+from . import counters
 from .models import Post, Like
-from accounts.utils import GetAuthTokenMixin
+from .reconciliation import reconcile_likes_counts
+from .search import search_post_ids
+from .serializers import LikeListSerializer, PostDetailSerializer, PostListSerializer
+from .tasks import flush_likes_counters, purge_post
+from .trending import count_likes, rebuild_rankings
+from .views import PostDetailAPIView, PostListAPIView
+from accounts.serializers import UserDetailSerializer
+from accounts.utils import GetAuthTokenMixin, QueryBudgetMixin
+from simple_api.middleware import brotli
+from simple_api.values_serialization import compile_row_serializer
 
 User = get_user_model()
 
@@ -34,6 +54,270 @@ class LikeModelTest(TestCase):
         self.assertEqual(post.number_of_likes, 4)
 
 
+class LikeManagerTests(TestCase):
+    """
+    Test the like toggle of the Like manager.
+
+    """
+
+    def test_toggle(self):
+        post = mixer.blend(Post)
+        user = mixer.blend(User)
+        self.assertTrue(Like.objects.toggle(user.id, post.id))
+        post.refresh_from_db()
+        self.assertEqual(post.number_of_likes, 1)
+        self.assertTrue(Like.objects.filter(user=user, post=post).exists())
+        self.assertFalse(Like.objects.toggle(user.id, post.id))
+        post.refresh_from_db()
+        self.assertEqual(post.number_of_likes, 0)
+        self.assertFalse(Like.objects.filter(user=user, post=post).exists())
+
+    def test_toggle_many_users(self):
+        post = mixer.blend(Post)
+        users = mixer.cycle(5).blend(User)
+        for user in users:
+            Like.objects.toggle(user.id, post.id)
+        post.refresh_from_db()
+        self.assertEqual(post.number_of_likes, 5)
+        self.assertEqual(post.likes.count(), 5)
+
+    def test_toggle_not_existing_post(self):
+        user = mixer.blend(User)
+        with self.assertRaises(Post.DoesNotExist):
+            Like.objects.toggle(user.id, 10)
+        self.assertFalse(Like.objects.exists())
+
+
+@override_settings(POSTS_LIKES_COUNTER='redis')
+class LikesCounterBufferTests(TestCase):
+    """
+    Test the Redis write-behind buffer of the likes counter.
+
+    """
+
+    def setUp(self):
+        self.redis = MagicMock()
+        patcher = patch('posts.counters.get_redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_toggle_buffers_delta(self):
+        post = mixer.blend(Post)
+        user = mixer.blend(User)
+        with patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            self.assertTrue(Like.objects.toggle(user.id, post.id))
+        self.redis.hincrby.assert_called_with('posts:likes:pending', post.id, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.number_of_likes, 0)
+
+    def test_serializers_merge_pending_delta(self):
+        posts = mixer.cycle(2).blend(Post, number_of_likes=1)
+        pipe = self.redis.pipeline.return_value
+        pipe.execute.return_value = [[b'2', None], [b'1', None], None]
+        data = PostListSerializer(posts, many=True).data
+        self.assertEqual([item['number_of_likes'] for item in data], [4, 1])
+        self.assertEqual(pipe.execute.call_count, 1)
+
+    def test_post_list_view_merges_pending_delta(self):
+        post = mixer.blend(Post, number_of_likes=1)
+        pipe = self.redis.pipeline.return_value
+        pipe.execute.return_value = [[b'2'], [None], None]
+        response = self.client.get(reverse('api_posts:post_list'), {'fields': 'number_of_likes'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [{'number_of_likes': 3}])
+        pipe.hmget.assert_any_call('posts:likes:pending', [post.id])
+
+    def set_flushing(self, deltas, flush_id=b'flush-1'):
+        keys = {'posts:likes:pending': False, 'posts:likes:flushing': True}
+        self.redis.exists.side_effect = lambda key: keys[key]
+        self.redis.get.return_value = flush_id
+        self.redis.hgetall.return_value = {str(post_id).encode(): str(delta).encode()
+                                           for post_id, delta in deltas.items()}
+
+    def test_flush(self):
+        posts = mixer.cycle(2).blend(Post, number_of_likes=1)
+        self.set_flushing({posts[0].id: 3, posts[1].id: -1})
+        self.assertEqual(flush_likes_counters(), 2)
+        self.redis.pipeline.return_value.delete.assert_any_call('posts:likes:flushing')
+        self.assertEqual(Post.objects.get(id=posts[0].id).number_of_likes, 4)
+        self.assertEqual(Post.objects.get(id=posts[1].id).number_of_likes, 0)
+
+    def test_flush_retried_after_commit(self):
+        post = mixer.blend(Post, number_of_likes=1)
+        self.set_flushing({post.id: 3})
+        with patch('posts.counters.ack_flushed_deltas', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                flush_likes_counters()
+        self.assertEqual(Post.objects.get(id=post.id).number_of_likes, 4)
+        # the hash is still moved aside, but its deltas are in the database
+        pipe = self.redis.pipeline.return_value
+        pipe.execute.return_value = [[None], [b'3'], b'flush-1']
+        self.assertEqual(counters.get_pending_deltas([post.id]), {})
+        # the next flush does not apply it again
+        flush_likes_counters()
+        self.assertEqual(Post.objects.get(id=post.id).number_of_likes, 4)
+        # a new flush is applied
+        self.set_flushing({post.id: 2}, flush_id=b'flush-2')
+        flush_likes_counters()
+        self.assertEqual(Post.objects.get(id=post.id).number_of_likes, 6)
+
+    def test_pending_deltas_count_flushing_until_applied(self):
+        post = mixer.blend(Post)
+        pipe = self.redis.pipeline.return_value
+        pipe.execute.return_value = [[b'1'], [b'3'], b'flush-1']
+        self.assertEqual(counters.get_pending_deltas([post.id]), {post.id: 4})
+
+
+class ReconciliationTests(TestCase):
+    """
+    Test the repair of drifted likes counters.
+
+    """
+
+    def test_reconcile_likes_counts(self):
+        posts = mixer.cycle(5).blend(Post)
+        for post in posts:
+            mixer.cycle(3).blend(Like, post=post)
+        Post.objects.filter(id=posts[0].id).update(number_of_likes=10)
+        Post.objects.filter(id=posts[3].id).update(number_of_likes=0)
+        result = reconcile_likes_counts(chunk_size=2)
+        self.assertEqual(result.checked, 5)
+        self.assertEqual(result.fixed, 2)
+        self.assertEqual(list(Post.objects.values_list('number_of_likes', flat=True)), [3] * 5)
+        self.assertEqual(reconcile_likes_counts().fixed, 0)
+
+    def test_reconcile_likes_command(self):
+        post = mixer.blend(Post, number_of_likes=2)
+        out = StringIO()
+        call_command('reconcile_likes', stdout=out)
+        self.assertIn('Checked 1 posts, fixed 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual(post.number_of_likes, 0)
+
+
+class TrendingPostsTests(TestCase):
+    """
+    Test the trending posts ranking and feed.
+
+    """
+
+    def setUp(self):
+        self.redis = MagicMock()
+        patcher = patch('posts.trending.get_redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_bucket_counts(self):
+        """
+        Counts of the current hour bucket from the last count_likes() call
+        """
+        pipe = self.redis.pipeline.return_value
+        counts = {}
+        for call in pipe.method_calls:
+            name, args = call[0], call[1]
+            if name == 'delete':
+                bucket_key, counts = args[0], {}
+            elif name == 'zadd' and args[0] == bucket_key:
+                counts[args[2]] = args[1]
+        self.assertTrue(bucket_key.startswith('posts:trending:bucket:'))
+        return counts
+
+    def test_count_likes(self):
+        post = mixer.blend(Post)
+        mixer.cycle(3).blend(Like, post=post)
+        self.redis.zrange.return_value = []
+        self.assertEqual(count_likes(), 3)
+        self.assertEqual(self.get_bucket_counts(), {post.id: 3})
+        # the completed hours are counted once
+        pipe = self.redis.pipeline.return_value
+        counted_hours = [args[1] for args, _ in pipe.zadd.call_args_list if args[0] == 'posts:trending:counted-hours']
+        self.assertEqual(len(counted_hours), 24 * 7 - 1)
+        pipe.reset_mock()
+        self.redis.zrange.return_value = [str(hour).encode() for hour in counted_hours]
+        self.assertEqual(count_likes(), 3)
+        self.assertEqual(pipe.execute.call_count, 2)
+
+    def test_count_likes_toggles(self):
+        post = mixer.blend(Post)
+        user = mixer.blend(User)
+        self.redis.zrange.return_value = []
+        for _ in range(5):
+            Like.objects.toggle(user.id, post.id)
+            self.assertEqual(count_likes(), 1)
+            self.assertEqual(self.get_bucket_counts(), {post.id: 1})
+            self.redis.pipeline.return_value.reset_mock()
+            Like.objects.toggle(user.id, post.id)
+            self.assertEqual(count_likes(), 0)
+            self.assertEqual(self.get_bucket_counts(), {})
+
+    def test_rebuild_rankings_removes_hidden_posts(self):
+        post = mixer.blend(Post)
+        hidden_post = mixer.blend(Post, is_published=False)
+        self.redis.zrange.return_value = [str(post.id).encode(), str(hidden_post.id).encode()]
+        rebuild_rankings()
+        self.redis.zrem.assert_called_with('posts:trending:week:tmp', hidden_post.id)
+        self.redis.rename.assert_called_with('posts:trending:week:tmp', 'posts:trending:week')
+
+    def test_trending_view(self):
+        posts = mixer.cycle(3).blend(Post)
+        hidden_post = mixer.blend(Post, is_published=False)
+        # hidden after the rebuild of the ranking
+        self.redis.zcard.return_value = 4
+        self.redis.zrevrange.return_value = [str(post_id).encode() for post_id in
+                                             (posts[2].id, hidden_post.id, posts[0].id, posts[1].id)]
+        response = self.client.get(reverse('api_posts:trending') + '?window=week')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 4)
+        self.redis.zrange.assert_not_called()
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [posts[2].id, posts[0].id, posts[1].id])
+        self.redis.zrevrange.assert_called_with('posts:trending:week', 0, 19)
+        response = self.client.get(reverse('api_posts:trending') + '?window=year')
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(TestCase):
+    """
+    Test the full-text search index and endpoint.
+
+    """
+
+    def test_index_follows_posts(self):
+        post = mixer.blend(Post, title='Cooking with garlic', content='')
+        self.assertEqual([post_id for post_id, _ in search_post_ids('garlic', 10)], [post.id])
+        post.title = 'Cooking with onions'
+        post.save()
+        self.assertEqual(search_post_ids('garlic', 10), [])
+        self.assertEqual(len(search_post_ids('onion', 10)), 1)
+        post.delete()
+        self.assertEqual(search_post_ids('onion', 10), [])
+
+    def test_search_view(self):
+        best = mixer.blend(Post, title='Garlic bread', content='garlic and more garlic')
+        others = [mixer.blend(Post, title='Post %d' % i, content='some garlic') for i in range(3)]
+        mixer.blend(Post, title='Garlic draft', is_published=False)
+        mixer.blend(Post, title='Unrelated', content='nothing here')
+        response = self.client.get(reverse('api_posts:search'), {'q': 'garlic', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['id'], best.id)
+        found = [item['id'] for item in response.data['results']]
+        response = self.client.get(response.data['next'])
+        found += [item['id'] for item in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(sorted(found), sorted([best.id] + [post.id for post in others]))
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], found[:2])
+        self.assertEqual(self.client.get(reverse('api_posts:search')).status_code, 400)
+        # the query syntax of the backend is not exposed
+        response = self.client.get(reverse('api_posts:search'), {'q': '"garlic*'})
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_search_view_not_supported(self):
+        with patch.dict('posts.search.BACKENDS', clear=True):
+            response = self.client.get(reverse('api_posts:search'), {'q': 'garlic'})
+        self.assertEqual(response.status_code, 501)
+
+
 class PostModelTests(TestCase):
     """
     Test the Post model and manager.
@@ -78,6 +362,7 @@ class ViewsTests(GetAuthTokenMixin, TestCase):
                  'last_name': 'Dou'}
 
     def setUp(self):
+        cache.clear()
         user = User.objects.create_user(**self.user_data)
         self.post = mixer.blend(Post, user=user)
         # client with JWT in headers
@@ -145,6 +430,125 @@ class ViewsTests(GetAuthTokenMixin, TestCase):
         response = self.client.get(reverse('api_posts:post_list'))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data['results']), 5)
+        # newest first, the order of the (is_published, timestamp, id) index
+        self.assertEqual([post['id'] for post in response.data['results']],
+                         [post.id for post in reversed(posts)] + [self.post.id])
+
+    def test_post_list_view_include_user(self):
+        author = mixer.blend(User)
+        mixer.cycle(3).blend(Post, user=author)
+        url = reverse('api_posts:post_list')
+        response = self.client.get(url, {'include': 'user'})
+        self.assertEqual(response.status_code, 200)
+        users = response.data['included']['user']
+        self.assertEqual([user['id'] for user in users], [author.id, self.post.user_id])
+        self.assertEqual(list(users[0]), UserDetailSerializer.Meta.fields)
+        self.assertNotIn('included', self.client.get(url).data)
+        self.assertEqual(self.client.get(url, {'include': 'likes'}).status_code, 400)
+        # the user_id key is loaded for the side-loading, but not shown
+        response = self.client.get(url, {'include': 'user', 'fields': 'id,title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title'])
+        self.assertEqual([user['id'] for user in response.data['included']['user']],
+                         [author.id, self.post.user_id])
+
+    def test_liked_by_me(self):
+        other_post = mixer.blend(Post)
+        Like.objects.toggle(self.post.user_id, self.post.id)
+        url = reverse('api_posts:post_list')
+        response = self.auth_client.get(url)
+        self.assertEqual({item['id']: item['liked_by_me'] for item in response.data['results']},
+                         {self.post.id: True, other_post.id: False})
+        self.assertEqual(list(response.data['results'][0])[-1], 'liked_by_me')
+        self.assertNotIn('liked_by_me', self.client.get(url).data['results'][0])
+        self.assertNotIn('liked_by_me', self.auth_client.get(url, {'fields': 'id'}).data['results'][0])
+        detail_url = reverse('api_posts:post_detail', kwargs={'pk': self.post.id})
+        response = self.auth_client.get(detail_url, {'fields': 'id,liked_by_me'})
+        self.assertEqual(response.data, {'id': self.post.id, 'liked_by_me': True})
+        # the pk is not one of the fields
+        response = self.auth_client.get(url, {'fields': 'title,liked_by_me'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][-1], {'title': self.post.title, 'liked_by_me': True})
+        response = self.auth_client.get(detail_url, {'fields': 'title,liked_by_me'})
+        self.assertEqual(response.data, {'title': self.post.title, 'liked_by_me': True})
+        response = self.auth_client.get(reverse('api_posts:post_detail', kwargs={'pk': other_post.id}))
+        self.assertFalse(response.data['liked_by_me'])
+
+    def test_post_list_view_cursor_pagination(self):
+        mixer.cycle(4).blend(Post)
+        expected_ids = list(Post.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        url = reverse('api_posts:post_list') + '?pagination=cursor&limit=2'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        ids = [item['id'] for item in response.data['results']]
+        next_url = response.data['next']
+        # new posts don't shift the next pages
+        mixer.blend(Post)
+        while next_url:
+            response = self.client.get(next_url)
+            ids += [item['id'] for item in response.data['results']]
+            previous_url, next_url = response.data['previous'], response.data['next']
+        self.assertEqual(ids, expected_ids)
+        response = self.client.get(previous_url)
+        self.assertEqual([item['id'] for item in response.data['results']], expected_ids[2:4])
+        response = self.client.get(reverse('api_posts:post_list') + '?pagination=cursor&cursor=bad')
+        self.assertEqual(response.status_code, 404)
+
+    @patch.object(PostListAPIView, 'cache_responses', False)
+    def test_post_list_view_count_modes(self):
+        mixer.cycle(24).blend(Post)
+        url = reverse('api_posts:post_list')
+        with patch.object(PostListAPIView, 'count_mode', 'none'):
+            response = self.client.get(url)
+        self.assertNotIn('count', response.data)
+        self.assertFalse(response.data['count_exact'])
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertTrue(response.data['next'])
+        with patch.object(PostListAPIView, 'count_mode', 'none'):
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+        cache.clear()
+        with patch.object(PostListAPIView, 'count_mode', 'cached'):
+            response = self.client.get(url)
+            self.assertEqual(response.data['count'], 25)
+            self.assertTrue(response.data['count_exact'])
+            mixer.blend(Post)
+            response = self.client.get(url)
+            self.assertEqual(response.data['count'], 25)
+            self.assertFalse(response.data['count_exact'])
+
+        # small tables (and SQLite) are counted exactly
+        with patch.object(PostListAPIView, 'count_mode', 'estimated'):
+            response = self.client.get(url)
+        self.assertEqual(response.data['count'], 26)
+
+    @patch.object(PostListAPIView, 'cache_responses', False)
+    def test_values_fast_path(self):
+        posts = mixer.cycle(3).blend(Post, title='Quote "\u2028 \u0444')
+        mixer.cycle(2).blend(Like, post=posts[0])
+        for url in [reverse('api_posts:post_list'), reverse('api_posts:post_list') + '?pagination=cursor',
+                    reverse('api_posts:likes_list', kwargs={'pk': posts[0].id})]:
+            fast_response = self.client.get(url)
+            with patch('simple_api.values_serialization.compile_row_serializer', return_value=None):
+                response = self.client.get(url)
+            self.assertEqual(fast_response.content, response.content)
+        self.assertIsNotNone(compile_row_serializer(PostListSerializer(many=True)))
+        self.assertIsNotNone(compile_row_serializer(LikeListSerializer(many=True)))
+        request = RequestFactory().get('/', {'likes': '1'})
+        self.assertIsNone(compile_row_serializer(PostDetailSerializer(context={'request': request})))
+
+    def test_like_list_view_cursor_pagination(self):
+        mixer.cycle(3).blend(Like, post=self.post)
+        url = reverse('api_posts:likes_list', kwargs={'pk': self.post.id}) + '?pagination=cursor&limit=2'
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
 
     def test_post_detail_view(self):
         response = self.client.get(reverse('api_posts:post_detail', kwargs={'pk': self.post.id}))
@@ -161,6 +565,157 @@ class ViewsTests(GetAuthTokenMixin, TestCase):
         self.assertTrue(response.data.get('likes'))
         self.assertEqual(len(response.data.get('likes')), 5)
 
+    def test_sparse_fieldsets(self):
+        url = reverse('api_posts:post_detail', kwargs={'pk': self.post.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'id,title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data), ['id', 'title'])
+        post_queries = [query['sql'] for query in queries if 'FROM "posts_post"' in query['sql']]
+        # the first query is the ETag one, the last one loads the post
+        self.assertNotIn('"posts_post"."content"', post_queries[-1])
+        response = self.client.get(reverse('api_posts:post_list'), {'fields': 'id,number_of_likes'})
+        self.assertEqual([list(item) for item in response.data['results']], [['id', 'number_of_likes']])
+        response = self.client.get(url, {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_LENGTH=100)
+    def test_response_compression(self):
+        mixer.cycle(3).blend(Like, post=self.post)
+        url = reverse('api_posts:post_detail', kwargs={'pk': self.post.id}) + '?likes=1'
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'br' if brotli else 'gzip')
+        self.assertEqual(compressed['ETag'], 'W/' + response['ETag'])
+        # the q-values are respected
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0.1, gzip;q=1.0')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), response.content)
+        with patch('simple_api.middleware.brotli', MagicMock()), \
+                patch('simple_api.middleware.brotli_compress', return_value=b'compressed'):
+            self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')['Content-Encoding'], 'br')
+            compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0.1, gzip;q=1.0')
+            self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_post_multi_detail_view(self):
+        posts = mixer.cycle(2).blend(Post)
+        hidden_post = mixer.blend(Post, is_published=False)
+        mixer.blend(Like, post=posts[1])
+        url = reverse('api_posts:post_multi_detail')
+        ids = [posts[1].id, self.post.id, hidden_post.id, 1000, posts[1].id]
+        response = self.client.get(url, {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [posts[1].id, self.post.id])
+        self.assertEqual(response.data['missing'], [hidden_post.id, 1000])
+        self.assertNotIn('likes', response.data['results'][0])
+        response = self.client.get(url, {'ids': str(posts[1].id), 'likes': '1'})
+        self.assertEqual(len(response.data['results'][0]['likes']), 1)
+        self.assertEqual(self.client.get(url, {'ids': '1,a'}).status_code, 400)
+        with override_settings(POSTS_MULTI_GET_MAX_SIZE=2):
+            self.assertEqual(self.client.get(url, {'ids': '1,2,3'}).status_code, 400)
+
+    def test_views_queries(self):
+        mixer.cycle(20).blend(Post)
+        likes = mixer.cycle(30).blend(Like, post=self.post)
+        # ETag, count and page
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api_posts:post_list'))
+        self.assertEqual(response.data['results'][0]['user_id'], Post.objects.get(
+            id=response.data['results'][0]['id']).user_id)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('api_posts:post_list') + '?pagination=cursor')
+        with self.assertNumQueries(2):
+            self.client.get(reverse('api_posts:likes_list', kwargs={'pk': self.post.id}))
+        # ETag, post with the author and likes with the users
+        url = reverse('api_posts:post_detail', kwargs={'pk': self.post.id}) + '?likes=1'
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['likes']), 30)
+        self.assertEqual(response.data['likes'][0]['user']['email'], likes[0].user.email)
+
+    def test_response_cache(self):
+        url = reverse('api_posts:post_detail', kwargs={'pk': self.post.id})
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        # ETag only
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['id'], self.post.id)
+        # another query params
+        self.assertEqual(self.client.get(url + '?likes=1')['X-Cache'], 'MISS')
+        # like toggle
+        self.auth_client.post(reverse('api_posts:likes'), data={'user_id': self.post.user_id,
+                                                                'post_id': self.post.id})
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['number_of_likes'], 1)
+        self.client.get(reverse('api_posts:post_list'))
+        self.assertEqual(self.client.get(reverse('api_posts:post_list'))['X-Cache'], 'HIT')
+        # post update
+        self.post.title = 'New title'
+        self.post.save()
+        self.assertEqual(self.client.get(url).data['title'], 'New title')
+        response = self.client.get(reverse('api_posts:post_list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['title'], 'New title')
+        # author update
+        self.client.get(url)
+        self.post.user.last_login = timezone.now()
+        self.post.user.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.post.user.first_name = 'New name'
+        self.post.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['user']['first_name'], 'New name')
+        # authorized users and disabled cache
+        self.assertNotIn('X-Cache', self.auth_client.get(url))
+        with patch.object(PostDetailAPIView, 'cache_responses', False):
+            self.assertNotIn('X-Cache', self.client.get(url))
+
+    def test_conditional_get(self):
+        url = reverse('api_posts:post_detail', kwargs={'pk': self.post.id})
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # another representation
+        self.assertEqual(self.client.get(url + '?likes=1', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        list_url = reverse('api_posts:post_list')
+        list_etag = self.client.get(list_url)['ETag']
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        # like changes the post
+        Like.objects.toggle(self.post.user_id, self.post.id)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        mixer.blend(Post)
+        list_etag = self.client.get(list_url)['ETag']
+        Post.objects.filter(id=self.post.id).delete()
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        # a removed post does not raise Last-Modified, the list has none
+        response = self.client.get(list_url)
+        self.assertNotIn('Last-Modified', response)
+        list_etag = response['ETag']
+        Post.objects.delete_post(Post.objects.latest('id'))
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_conditional_get_author_change(self):
+        url = reverse('api_posts:post_detail', kwargs={'pk': self.post.id})
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        time.sleep(1)
+        self.post.user.first_name = 'New name'
+        self.post.user.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
     def test_post_create_view(self):
         # Unauthorized user
         response = self.client.post(reverse('api_posts:post_create'),
@@ -182,6 +737,29 @@ class ViewsTests(GetAuthTokenMixin, TestCase):
         self.assertEqual(post.user_id, self.post.user_id)
         self.assertEqual(Post.objects.all().count(), 2)
 
+    def test_post_bulk_create_view(self):
+        url = reverse('api_posts:post_bulk_create')
+        items = [{'title': 'First bulk post', 'content': 'one'},
+                 {'content': 'no title'},
+                 {'title': 'Second bulk post', 'is_published': False}]
+        response = self.client.post(url, data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        response = self.auth_client.post(url + '?atomic=1', data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertEqual(Post.objects.count(), 1)
+        response = self.auth_client.post(url, data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        first_id, invalid_id, second_id = response.data['ids']
+        self.assertIsNone(invalid_id)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(Post.objects.get(pk=first_id).title, 'First bulk post')
+        self.assertFalse(Post.objects.get(pk=second_id).is_published)
+        self.assertEqual(Post.objects.get(pk=second_id).user_id, self.post.user_id)
+        self.assertEqual([post_id for post_id, _ in search_post_ids('bulk', 10)], [first_id])
+        response = self.auth_client.post(url, data=json.dumps(items[0]), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
     def test_post_update_view(self):
         title = 'New title'
         data = json.dumps({'title': title})
@@ -212,3 +790,116 @@ class ViewsTests(GetAuthTokenMixin, TestCase):
         response = self.auth_client.delete(reverse('api_posts:post_delete', kwargs={'pk': self.post.id}))
         self.assertEqual(response.status_code, 204)
         self.assertEqual(Post.objects.count(), 1)
+
+    def test_post_delete_view_with_likes(self):
+        mixer.cycle(10).blend(Like, post=self.post)
+        url = reverse('api_posts:post_delete', kwargs={'pk': self.post.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        # no counter updates of the deleted post for every like
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Post._base_manager.exists())
+
+    @override_settings(POSTS_DELETE_MODE='async')
+    def test_post_delete_view_async(self):
+        mixer.cycle(10).blend(Like, post=self.post)
+        url = reverse('api_posts:post_delete', kwargs={'pk': self.post.id})
+        response = self.auth_client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        # hidden at once, deleted by the task
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(self.client.get(reverse('api_posts:post_detail', kwargs={'pk': self.post.id})).status_code, 404)
+        self.assertEqual(Like.objects.count(), 10)
+        purge_post(self.post.id, chunk_size=3)
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Post._base_manager.exists())
+
+
+class QueryBudgetTests(GetAuthTokenMixin, QueryBudgetMixin, TestCase):
+    """
+    The views must make a fixed number of queries for any number of rows.
+
+    """
+    user_data = {'email': 'test@mail.com',
+                 'password': 'somepassword',
+                 'first_name': 'John',
+                 'last_name': 'Dou'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(**self.user_data)
+        self.post = mixer.blend(Post, user=self.user)
+        self.auth_client = self.get_authorized_client(self.user_data['email'], self.user_data['password'])
+
+    def add_likes(self, number):
+        mixer.cycle(number).blend(Like, post=self.post)
+
+    def test_post_list_view(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse('api_posts:post_list')),
+                               lambda number: mixer.cycle(number).blend(Post))
+
+    def test_post_detail_view(self):
+        url = reverse('api_posts:post_detail', kwargs={'pk': self.post.id}) + '?likes=1'
+        self.assertQueryBudget(3, lambda: self.client.get(url), self.add_likes)
+
+    def test_post_list_view_authenticated(self):
+        def add_liked_posts(number):
+            for post in mixer.cycle(number).blend(Post):
+                Like.objects.toggle(self.user.id, post.id)
+
+        # user, ETag, count, page and liked posts
+        self.assertQueryBudget(5, lambda: self.auth_client.get(reverse('api_posts:post_list')), add_liked_posts)
+
+    def test_post_list_view_include_user(self):
+        url = reverse('api_posts:post_list')
+        # count, page and authors
+        self.assertQueryBudget(3, lambda: self.client.get(url, {'include': 'user'}),
+                               lambda number: mixer.cycle(number).blend(Post, user=mixer.blend(User)))
+
+    def test_post_multi_detail_view(self):
+        ids = [self.post.id]
+
+        def add_posts(number):
+            for post in mixer.cycle(number).blend(Post):
+                mixer.cycle(2).blend(Like, post=post)
+                ids.append(post.id)
+
+        def get_all():
+            return self.client.get(reverse('api_posts:post_multi_detail'),
+                                   {'ids': ','.join(map(str, ids)), 'likes': '1'})
+
+        # posts and likes with users
+        self.assertQueryBudget(2, get_all, add_posts)
+
+    def test_like_list_view(self):
+        url = reverse('api_posts:likes_list', kwargs={'pk': self.post.id})
+        self.assertQueryBudget(2, lambda: self.client.get(url), self.add_likes)
+
+    def test_like_or_unlike_view(self):
+        def add_likes(number):
+            Like.objects.filter(user=self.user).delete()
+            self.add_likes(number)
+
+        data = {'user_id': self.user.id, 'post_id': self.post.id}
+        # user, savepoints, delete, insert and update of the counter
+        self.assertQueryBudget(8, lambda: self.auth_client.post(reverse('api_posts:likes'), data=data),
+                               add_likes)
+
+    @override_settings(DEBUG=True)
+    def test_query_count_headers(self):
+        response = self.client.get(reverse('api_posts:post_list'))
+        self.assertEqual(response['X-DB-Query-Count'], '3')
+        self.assertIn('X-DB-Query-Time', response)
+
+    @override_settings(DEBUG=True)
+    def test_query_count_headers_full_log(self):
+        # the log is not reset by the requests of a long-lived worker
+        request_started.disconnect(reset_queries)
+        self.addCleanup(request_started.connect, reset_queries)
+        connection.queries_log.extend([{'sql': '', 'time': '0.000'}] * connection.queries_limit)
+        response = self.client.get(reverse('api_posts:post_list'))
+        self.assertEqual(response['X-DB-Query-Count'], '3')
+        self.assertEqual(len(connection.queries_log), connection.queries_limit)
+        self.assertTrue(connection.queries_log[-1]['sql'])
@@ -0,0 +1,143 @@
+"""
+Precomputed trending posts.
+The likes are counted by their timestamp into hourly Redis sorted sets: the
+recent buckets are recounted from the Like table on every run (so an unlike
+removes the like and likes committed late are counted), the older ones are
+counted once. The ranking of every window is the weighted union of its hourly
+buckets: the weight halves every half-life hours (time decay) and the oldest
+bucket is weighted by its part inside the window. Posts which are not published
+are removed from the rankings. Reading a page of the feed is ZREVRANGE of the page size.
+"""
+import calendar
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.db.models import Count
+from django.utils import timezone
+
+from simple_api.redis_client import get_redis_client
+from .models import Like, Post
+
+# window: (hours, half-life in hours)
+WINDOWS = OrderedDict([
+    ('hour', (1, None)),
+    ('day', (24, 6)),
+    ('week', (24 * 7, 48)),
+])
+DEFAULT_WINDOW = 'day'
+RANKING_SIZE = 1000
+
+BUCKET_KEY = 'posts:trending:bucket:%d'
+RANKING_KEY = 'posts:trending:%s'
+# hours of the buckets which are not recounted
+COUNTED_HOURS_KEY = 'posts:trending:counted-hours'
+# the current and the previous hour
+RECOUNTED_HOURS = 2
+
+
+def get_hour(dt):
+    return calendar.timegm(dt.utctimetuple()) // 3600
+
+
+def get_hour_range(hour):
+    start = datetime.fromtimestamp(hour * 3600, timezone.utc)
+    return start, start + timedelta(hours=1)
+
+
+def count_likes():
+    """
+    Recount the recent hourly buckets and count the older ones not counted yet.
+    A bucket is replaced in one Redis transaction.
+    Returns the number of likes in the counted buckets.
+    """
+    client = get_redis_client()
+    max_hours = max(hours for hours, _ in WINDOWS.values())
+    current_hour = get_hour(timezone.now())
+    min_hour = current_hour - max_hours
+    client.zremrangebyscore(COUNTED_HOURS_KEY, '-inf', min_hour - 1)
+    counted_hours = {int(hour) for hour in client.zrange(COUNTED_HOURS_KEY, 0, -1)}
+    recounted_from = current_hour - RECOUNTED_HOURS + 1
+    hours = [hour for hour in range(min_hour, recounted_from) if hour not in counted_hours]
+    hours += list(range(recounted_from, current_hour + 1))
+    counted = 0
+    for hour in hours:
+        start, end = get_hour_range(hour)
+        counts = Like.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by().values(
+            'post_id').annotate(count=Count('pk')).values_list('post_id', 'count')
+        key = BUCKET_KEY % hour
+        pipe = client.pipeline()
+        pipe.delete(key)
+        for post_id, count in counts:
+            pipe.zadd(key, count, post_id)
+            counted += count
+        pipe.expire(key, (max_hours + 2) * 3600)
+        if hour < recounted_from:
+            pipe.zadd(COUNTED_HOURS_KEY, hour, hour)
+        pipe.execute()
+    return counted
+
+
+def get_bucket_weights(hours, half_life, now):
+    """
+    Return {bucket key: weight} of the window ending now
+    """
+    current_hour = get_hour(now)
+    passed = (now.minute * 60 + now.second) / 3600.0
+    weights = {}
+    for age in range(hours + 1):
+        weight = 0.5 ** (age / float(half_life)) if half_life else 1.0
+        if age == hours:
+            # only the end of the oldest bucket is inside the window
+            weight *= 1 - passed
+        if weight > 0:
+            weights[BUCKET_KEY % (current_hour - age)] = weight
+    return weights
+
+
+def rebuild_rankings():
+    """
+    Replace the ranking of every window with the union of its buckets
+    """
+    client = get_redis_client()
+    now = timezone.now()
+    for window, (hours, half_life) in WINDOWS.items():
+        key = RANKING_KEY % window
+        tmp_key = key + ':tmp'
+        client.zunionstore(tmp_key, get_bucket_weights(hours, half_life, now))
+        # some of the best posts may be hidden
+        client.zremrangebyrank(tmp_key, 0, -(RANKING_SIZE * 2 + 1))
+        post_ids = [int(post_id) for post_id in client.zrange(tmp_key, 0, -1)]
+        active_ids = set(Post.objects.get_active_posts().filter(pk__in=post_ids).values_list('pk', flat=True))
+        hidden_ids = [post_id for post_id in post_ids if post_id not in active_ids]
+        if hidden_ids:
+            client.zrem(tmp_key, *hidden_ids)
+        client.zremrangebyrank(tmp_key, 0, -(RANKING_SIZE + 1))
+        if client.exists(tmp_key):
+            client.rename(tmp_key, key)
+        else:
+            client.delete(key)
+
+
+class TrendingPosts(object):
+    """
+    Lazy sequence of the posts of a ranking for the paginators. The hidden
+    posts are removed by rebuild_rankings(), the posts hidden since the
+    last rebuild are counted, but skipped in the pages (taken from the queryset)
+    """
+    def __init__(self, window, queryset):
+        self.key = RANKING_KEY % window
+        self.queryset = queryset
+
+    def __len__(self):
+        return get_redis_client().zcard(self.key)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step:
+            raise TypeError('TrendingPosts supports only slices')
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else 0
+        if index.stop is not None and stop <= start:
+            return []
+        ids = [int(post_id) for post_id in get_redis_client().zrevrange(self.key, start, stop - 1)]
+        posts = self.queryset.in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
@@ -2,18 +2,26 @@ from django.conf.urls import url
 from .views import (
     like_or_unlike_view,
     PostUpdateAPIView,
+    PostBulkCreateAPIView,
     PostCreateAPIView,
     PostDeleteAPIView,
     PostDetailAPIView,
+    PostMultiDetailAPIView,
     PostListAPIView,
-    LikeListAPIView
+    LikeListAPIView,
+    PostSearchAPIView,
+    TrendingPostListAPIView
 )
 
 urlpatterns = [
     url(r'^likes/$', like_or_unlike_view, name='likes'),
     url(r'^likes-list/(?P<pk>\d+)/$', LikeListAPIView.as_view(), name='likes_list'),
     url(r'^list/$', PostListAPIView.as_view(), name='post_list'),
+    url(r'^trending/$', TrendingPostListAPIView.as_view(), name='trending'),
+    url(r'^search/$', PostSearchAPIView.as_view(), name='search'),
     url(r'^create/$', PostCreateAPIView.as_view(), name='post_create'),
+    url(r'^bulk-create/$', PostBulkCreateAPIView.as_view(), name='post_bulk_create'),
+    url(r'^detail/$', PostMultiDetailAPIView.as_view(), name='post_multi_detail'),
     url(r'^detail/(?P<pk>\d+)/$', PostDetailAPIView.as_view(), name='post_detail'),
     url(r'^update/(?P<pk>\d+)/$', PostUpdateAPIView.as_view(), name='post_update'),
     url(r'^delete/(?P<pk>\d+)/$', PostDeleteAPIView.as_view(), name='post_delete'),
@@ -1,10 +1,19 @@
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework import status
 from rest_framework.generics import (
     CreateAPIView,
     DestroyAPIView,
+    GenericAPIView,
     ListAPIView,
     RetrieveAPIView,
     RetrieveUpdateAPIView
@@ -12,14 +21,27 @@ from rest_framework.generics import (
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from accounts.serializers import UserDetailSerializer
+from simple_api.query_plans import SerializerQuerysetMixin, plan_queryset
+from simple_api.side_loading import SideLoadMixin
+from simple_api.values_serialization import ValuesListMixin
+
 from .serializers import (
     PostDetailSerializer,
     PostCreateUpdateSerializer,
     PostListSerializer,
     LikeListSerializer
 )
-from .pagination import CustomLimitOffsetPagination
+from .conditional import (
+    post_detail_etag,
+    post_detail_last_modified,
+    post_list_etag
+)
+from .pagination import CustomLimitOffsetPagination, PaginationModeMixin, RankCursorPagination
 from .permissions import IsOwnerOrReadOnly
+from .response_cache import ResponseCacheMixin
+from .search import SearchResults
+from .trending import DEFAULT_WINDOW, WINDOWS, TrendingPosts
 from .models import Post, Like
 
 User = get_user_model()
@@ -33,28 +55,66 @@ def like_or_unlike_view(request):
         post_id = int(request.POST.get('post_id'))
     except ValueError as e:
         return Response({'error': e.args[0]})
-    user = get_object_or_404(User, id=user_id)
-    post = get_object_or_404(Post, id=post_id)
-    like, created = Like.objects.get_or_create(user=user, post=post)
-    if not created:
-        like.delete()
-    return Response({'liked': created})
+    if user_id != request.user.id:
+        get_object_or_404(User, id=user_id)
+    try:
+        liked = Like.objects.toggle(user_id, post_id)
+    except Post.DoesNotExist:
+        raise Http404
+    return Response({'liked': liked})
 
 
-class LikeListAPIView(ListAPIView):
+class LikeListAPIView(PaginationModeMixin, SerializerQuerysetMixin, ValuesListMixin, ListAPIView):
     serializer_class = LikeListSerializer
     pagination_class = CustomLimitOffsetPagination
+    count_mode = 'exact'
 
     def get_queryset(self):
         post_id = self.kwargs.get('pk')
-        return Like.objects.filter(post_id=post_id)
+        return Like.objects.filter(post_id=post_id).order_by('-timestamp', '-id')
 
 
-class PostDetailAPIView(RetrieveAPIView):
+@method_decorator(condition(post_detail_etag, post_detail_last_modified), name='get')
+class PostDetailAPIView(ResponseCacheMixin, SerializerQuerysetMixin, RetrieveAPIView):
     serializer_class = PostDetailSerializer
     queryset = Post.objects.all()
 
 
+class PostMultiDetailAPIView(SerializerQuerysetMixin, ListAPIView):
+    """
+    Published posts of ?ids=1,2,3 in the requested order (?likes=1 adds the likes),
+    the ids which are not found are listed in "missing"
+    """
+    serializer_class = PostDetailSerializer
+    queryset = Post.objects.get_active_posts()
+    pagination_class = None
+    ids_query_param = 'ids'
+
+    def get_ids(self):
+        value = self.request.query_params.get(self.ids_query_param, '')
+        try:
+            ids = [int(post_id) for post_id in value.split(',') if post_id.strip()]
+        except ValueError:
+            raise ValidationError({self.ids_query_param: 'Must be a comma separated list of ids.'})
+        if not ids:
+            raise ValidationError({self.ids_query_param: 'This parameter is required.'})
+        ids = list(OrderedDict.fromkeys(ids))
+        if len(ids) > settings.POSTS_MULTI_GET_MAX_SIZE:
+            raise ValidationError({self.ids_query_param: 'Ensure there are no more than %d ids.' %
+                                   settings.POSTS_MULTI_GET_MAX_SIZE})
+        return ids
+
+    def list(self, request, *args, **kwargs):
+        ids = self.get_ids()
+        posts = self.filter_queryset(self.get_queryset()).in_bulk(ids)
+        found = [posts[post_id] for post_id in ids if post_id in posts]
+        serializer = self.get_serializer(found, many=True)
+        return Response(OrderedDict([
+            ('results', serializer.data),
+            ('missing', [post_id for post_id in ids if post_id not in posts]),
+        ]))
+
+
 class PostCreateAPIView(CreateAPIView):
     serializer_class = PostCreateUpdateSerializer
     queryset = Post.objects.all()
@@ -64,6 +124,38 @@ class PostCreateAPIView(CreateAPIView):
         serializer.save(user=self.request.user)
 
 
+class PostBulkCreateAPIView(GenericAPIView):
+    """
+    Create the posts of a JSON array in one transaction.
+    Returns {"ids": [...], "errors": [...]}, ids are in the order of the array
+    with null for the invalid items, errors are [{"index": n, "errors": {...}}].
+    The valid items are created unless ?atomic=1 is given.
+    """
+    serializer_class = PostCreateUpdateSerializer
+    queryset = Post.objects.all()
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of posts.']})
+        if len(request.data) > settings.POSTS_BULK_CREATE_MAX_SIZE:
+            raise ValidationError({'non_field_errors': [
+                'Ensure this list has no more than %d posts.' % settings.POSTS_BULK_CREATE_MAX_SIZE]})
+        posts, errors = [], []
+        for index, item in enumerate(request.data):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                posts.append(Post(user=request.user, **serializer.validated_data))
+            else:
+                posts.append(None)
+                errors.append({'index': index, 'errors': serializer.errors})
+        if errors and request.query_params.get('atomic') == '1':
+            return Response({'ids': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        Post.objects.create_many([post for post in posts if post is not None])
+        ids = [post.pk if post is not None else None for post in posts]
+        return Response({'ids': ids, 'errors': errors}, status=status.HTTP_201_CREATED)
+
+
 class PostUpdateAPIView(RetrieveUpdateAPIView):
     queryset = Post.objects.all()
     serializer_class = PostCreateUpdateSerializer
@@ -75,8 +167,49 @@ class PostDeleteAPIView(DestroyAPIView):
     serializer_class = PostDetailSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
 
+    def perform_destroy(self, instance):
+        Post.objects.delete_post(instance)
 
-class PostListAPIView(ListAPIView):
+
+@method_decorator(condition(etag_func=post_list_etag), name='get')
+class PostListAPIView(ResponseCacheMixin, PaginationModeMixin, SideLoadMixin, SerializerQuerysetMixin,
+                      ValuesListMixin, ListAPIView):
+    """
+    Published posts, newest first, ?include=user adds the authors of the page
+    """
     serializer_class = PostListSerializer
-    queryset = Post.objects.get_active_posts()
+    side_loads = {'user': ('user_id', UserDetailSerializer)}
+    queryset = Post.objects.get_active_posts().order_by('-timestamp', '-id')
     pagination_class = CustomLimitOffsetPagination
+    count_mode = 'exact'
+
+
+class TrendingPostListAPIView(ListAPIView):
+    """
+    Posts ordered by the precomputed trending ranking of ?window=hour|day|week
+    """
+    serializer_class = PostListSerializer
+    pagination_class = CustomLimitOffsetPagination
+
+    def get_queryset(self):
+        window = self.request.query_params.get('window', DEFAULT_WINDOW)
+        if window not in WINDOWS:
+            raise ValidationError({'window': 'Must be one of: %s' % ', '.join(WINDOWS)})
+        queryset = plan_queryset(Post.objects.get_active_posts(), self.get_serializer())
+        return TrendingPosts(window, queryset)
+
+
+class PostSearchAPIView(ListAPIView):
+    """
+    Published posts matching ?q= in the title or the content, most relevant first
+    """
+    serializer_class = PostListSerializer
+    pagination_class = RankCursorPagination
+    search_query_param = 'q'
+
+    def get_queryset(self):
+        text = self.request.query_params.get(self.search_query_param, '').strip()
+        if not text:
+            raise ValidationError({self.search_query_param: 'This parameter is required.'})
+        queryset = plan_queryset(Post.objects.get_active_posts(), self.get_serializer())
+        return SearchResults(text, queryset)
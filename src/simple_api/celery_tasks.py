@@ -19,8 +19,24 @@ app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
 
 app.conf.beat_schedule = {
-    'hello': {
-        'task': 'accounts.tasks.hello',
-        'schedule': crontab()
+    'reconcile-likes': {
+        'task': 'posts.tasks.reconcile_likes',
+        'schedule': crontab(minute=0)
+    },
+    'flush-likes-counters': {
+        'task': 'posts.tasks.flush_likes_counters',
+        'schedule': settings.POSTS_LIKES_FLUSH_INTERVAL
+    },
+    'refresh-trending-posts': {
+        'task': 'posts.tasks.refresh_trending_posts',
+        'schedule': settings.POSTS_TRENDING_REFRESH_INTERVAL
+    },
+    'backfill-additional-info': {
+        'task': 'accounts.tasks.backfill_additional_info',
+        'schedule': settings.ACCOUNTS_ENRICHMENT_BACKFILL_INTERVAL
+    },
+    'send-queued-emails': {
+        'task': 'accounts.tasks.send_queued_emails',
+        'schedule': settings.EMAIL_QUEUE_FLUSH_INTERVAL
     }
 }
@@ -0,0 +1,177 @@
+"""
+Outgoing email queue.
+
+With EMAIL_DELIVERY_MODE = 'queue' send_email() pushes the message to a Redis list
+after the commit instead of sending it in the request. The accounts.tasks.send_queued_emails
+task takes the messages in batches and sends them over one connection of EMAIL_BACKEND,
+at most EMAIL_QUEUE_RATE_LIMIT messages per second. A message failed with a transient
+error (a 4xx reply, a dropped connection) is pushed back with the rest of the batch and
+retried by the next run, up to EMAIL_QUEUE_MAX_ATTEMPTS times, other failures are moved
+to the failed list. The taken messages are moved to the processing list (RPOPLPUSH) and
+removed from it one by one when they are sent, the messages left there by a killed
+worker are returned to the queue by the next run.
+"""
+import json
+import logging
+import time
+from collections import namedtuple
+from smtplib import SMTPRecipientsRefused, SMTPResponseException
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import transaction
+from redis.exceptions import LockError
+
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# pushed to the head, taken from the tail
+QUEUE_KEY = 'mail:queue'
+PROCESSING_KEY = 'mail:processing'
+FAILED_KEY = 'mail:failed'
+SEND_LOCK_KEY = 'mail:send-lock'
+
+SendResult = namedtuple('SendResult', ['sent', 'retried', 'failed', 'duration'])
+
+
+def is_queued():
+    return settings.EMAIL_DELIVERY_MODE == 'queue'
+
+
+def send_email(subject, body, from_email, recipient_list):
+    """
+    send_mail() or, in the 'queue' mode, enqueue the message after the current transaction
+    """
+    if not is_queued():
+        return send_mail(subject, body, from_email, recipient_list, fail_silently=False)
+    payload = json.dumps({
+        'subject': subject,
+        'body': body,
+        'from_email': from_email,
+        'to': list(recipient_list),
+        'attempts': 0,
+    })
+    transaction.on_commit(lambda: get_redis_client().lpush(QUEUE_KEY, payload))
+    return 1
+
+
+def take_messages(count):
+    """
+    Move up to count oldest messages of the queue to the processing list
+    and return them as [(payload, message)]
+    """
+    pipe = get_redis_client().pipeline(transaction=False)
+    for _ in range(count):
+        pipe.rpoplpush(QUEUE_KEY, PROCESSING_KEY)
+    payloads = [payload for payload in pipe.execute() if payload is not None]
+    return [(payload, json.loads(payload.decode('utf-8'))) for payload in payloads]
+
+
+def ack_message(payload):
+    """
+    Remove the sent message from the processing list
+    """
+    get_redis_client().lrem(PROCESSING_KEY, -1, payload)
+
+
+def fail_message(payload, message):
+    pipe = get_redis_client().pipeline()
+    pipe.lrem(PROCESSING_KEY, -1, payload)
+    pipe.rpush(FAILED_KEY, json.dumps(message))
+    pipe.execute()
+
+
+def return_messages(items):
+    """
+    Move the [(payload, message)] taken messages back to the tail of the queue,
+    so they are taken again first and in the same order
+    """
+    if not items:
+        return
+    pipe = get_redis_client().pipeline()
+    for payload, _ in items:
+        pipe.lrem(PROCESSING_KEY, -1, payload)
+    pipe.rpush(QUEUE_KEY, *[json.dumps(message) for _, message in reversed(items)])
+    pipe.execute()
+
+
+def requeue_stale_messages():
+    """
+    Return the messages left in the processing list by a killed worker to the tail
+    of the queue, must be called with the send lock held.
+    Returns the number of the returned messages.
+    """
+    client = get_redis_client()
+    # newest first, the oldest is pushed last and taken first
+    payloads = client.lrange(PROCESSING_KEY, 0, -1)
+    if payloads:
+        pipe = client.pipeline()
+        pipe.rpush(QUEUE_KEY, *payloads)
+        pipe.ltrim(PROCESSING_KEY, 0, -(len(payloads) + 1))
+        pipe.execute()
+    return len(payloads)
+
+
+def is_transient_error(error):
+    if isinstance(error, SMTPRecipientsRefused):
+        return False
+    if isinstance(error, SMTPResponseException):
+        return error.smtp_code < 500
+    return True
+
+
+def get_send_lock(timeout):
+    return get_redis_client().lock(SEND_LOCK_KEY, timeout=timeout)
+
+
+def send_queued_emails(batch_size=100, max_messages=1000, lock=None):
+    """
+    Send up to max_messages queued messages over one connection.
+    Stops at the first transient failure, the not sent messages are left in the queue.
+    The send lock is extended by the time of the previous batch before every batch,
+    the run stops when the lock is lost, so another run may have taken it.
+    """
+    started = extended = time.time()
+    rate_limit = settings.EMAIL_QUEUE_RATE_LIMIT
+    sent = retried = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        while sent + failed < max_messages:
+            if lock is not None and sent + failed:
+                now = time.time()
+                try:
+                    lock.extend(now - extended)
+                except LockError:
+                    logger.warning('Lost the email send lock after %d emails', sent + failed)
+                    break
+                extended = now
+            messages = take_messages(min(batch_size, max_messages - sent - failed))
+            if not messages:
+                break
+            for index, (payload, message) in enumerate(messages):
+                if rate_limit:
+                    # sent / rate_limit seconds at least since the start
+                    delay = started + sent * 1.0 / rate_limit - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                try:
+                    connection.open()
+                    connection.send_messages([EmailMessage(
+                        message['subject'], message['body'], message['from_email'], message['to'])])
+                except Exception as error:
+                    message['attempts'] += 1
+                    if not is_transient_error(error) or message['attempts'] >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+                        logger.error('Failed to send the email to %s: %r', message['to'], error)
+                        fail_message(payload, message)
+                        failed += 1
+                        continue
+                    logger.warning('Failed to send the email to %s, will retry: %r', message['to'], error)
+                    return_messages(messages[index:])
+                    retried += 1
+                    return SendResult(sent, retried, failed, time.time() - started)
+                ack_message(payload)
+                sent += 1
+    finally:
+        connection.close()
+    return SendResult(sent, retried, failed, time.time() - started)
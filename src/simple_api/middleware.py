@@ -0,0 +1,120 @@
+import gzip
+import re
+from collections import deque
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class QueryCountMiddleware(object):
+    """
+    Add the number of SQL queries of the request and their total time (ms)
+    to the response as X-DB-Query-Count and X-DB-Query-Time headers.
+    Works only in debug mode, when Django logs the queries. The request is logged
+    to an empty log of every connection, which is appended to the connection log
+    afterwards (the log is bounded, so its length does not tell the new queries).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+        logs = {}
+        for connection in connections.all():
+            logs[connection.alias] = connection.queries_log
+            connection.queries_log = deque(maxlen=connection.queries_limit)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_logs = {}
+            for connection in connections.all():
+                request_logs[connection.alias] = connection.queries_log
+                connection.queries_log = logs[connection.alias]
+                connection.queries_log.extend(request_logs[connection.alias])
+        count, duration = 0, 0.0
+        for queries in request_logs.values():
+            count += len(queries)
+            duration += sum(float(query['time']) for query in queries)
+        response['X-DB-Query-Count'] = count
+        response['X-DB-Query-Time'] = '%.1f' % (duration * 1000)
+        return response
+
+
+def gzip_compress(data, level):
+    buffer = BytesIO()
+    # mtime=0 so the same content is compressed to the same bytes
+    with gzip.GzipFile(mode='wb', compresslevel=level, fileobj=buffer, mtime=0) as gzip_file:
+        gzip_file.write(data)
+    return buffer.getvalue()
+
+
+def brotli_compress(data, quality):
+    return brotli.compress(data, quality=quality)
+
+
+def get_accepted_encodings(request):
+    """
+    Return {content coding: q} of the codings accepted by the client (with q > 0)
+    """
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        match = re.search(r'q=([0-9.]+)', params)
+        try:
+            quality = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+        if coding and quality > 0:
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware(object):
+    """
+    Compress the JSON and text responses longer than RESPONSE_COMPRESSION_MIN_LENGTH
+    with the accepted coding of the highest q: brotli (if the brotli package is installed)
+    or gzip, brotli on a tie.
+    The compressed response keeps a weak ETag, since its bytes differ.
+    """
+    compressible_types = ('application/json', 'text/')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = get_accepted_encodings(request)
+        br_quality = accepted.get('br', 0) if brotli is not None else 0
+        gzip_quality = accepted.get('gzip', 0)
+        if br_quality and br_quality >= gzip_quality:
+            encoding, content = 'br', brotli_compress(response.content, settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+        elif gzip_quality:
+            encoding, content = 'gzip', gzip_compress(response.content, settings.RESPONSE_COMPRESSION_GZIP_LEVEL)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        return response
+
+    def is_compressible(self, response):
+        return (settings.RESPONSE_COMPRESSION and
+                not response.streaming and
+                not response.has_header('Content-Encoding') and
+                len(response.content) >= settings.RESPONSE_COMPRESSION_MIN_LENGTH and
+                response.get('Content-Type', '').startswith(self.compressible_types))
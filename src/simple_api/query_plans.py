@@ -0,0 +1,82 @@
+"""
+select_related/prefetch_related/only() plan of a queryset derived from the
+serializer which renders it, so a page costs a fixed number of queries.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+def plan_queryset(queryset, serializer, extra_fields=()):
+    """
+    Return the queryset with the related objects and the columns
+    used by the serializer (a ListSerializer or a single serializer).
+    extra_fields - model fields used outside the serializer (e.g. by the paginator)
+    """
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    select, prefetch, only = _get_plan(serializer, queryset.model)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only is not None:
+        queryset = queryset.only(*(only | set(extra_fields)))
+    return queryset
+
+
+def _get_concrete_fields(model, prefix):
+    return set(prefix + field.name for field in model._meta.concrete_fields)
+
+
+def _get_plan(serializer, model, prefix=''):
+    """
+    Return (select_related, prefetch_related, only) for the serializer fields,
+    only is None if some field can not be mapped on a model field
+    (SerializerMethodField, properties, dotted sources)
+    """
+    select, prefetch = [], []
+    only = {prefix + model._meta.pk.name}
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            only = None
+            continue
+        path = prefix + model_field.name
+        if isinstance(field, ListSerializer) and (model_field.one_to_many or model_field.many_to_many):
+            child_queryset = model_field.related_model._default_manager.all()
+            extra_fields = [model_field.field.name] if model_field.one_to_many else []
+            child_queryset = plan_queryset(child_queryset, field.child, extra_fields)
+            prefetch.append(Prefetch(path, queryset=child_queryset))
+        elif isinstance(field, BaseSerializer) and (model_field.many_to_one or model_field.one_to_one):
+            related_model = model_field.related_model
+            related_select, related_prefetch, related_only = _get_plan(field, related_model, path + '__')
+            select.append(path)
+            select.extend(related_select)
+            prefetch.extend(related_prefetch)
+            if only is not None:
+                only.add(path)
+                only |= related_only if related_only is not None else _get_concrete_fields(related_model,
+                                                                                           path + '__')
+        elif model_field.concrete:
+            if only is not None:
+                only.add(path)
+        else:
+            only = None
+    return select, prefetch, only
+
+
+class SerializerQuerysetMixin(object):
+    """
+    Plan the queryset of a generic view from its serializer
+    """
+    def filter_queryset(self, queryset):
+        queryset = super(SerializerQuerysetMixin, self).filter_queryset(queryset)
+        return plan_queryset(queryset, self.get_serializer(), self.get_extra_queryset_fields())
+
+    def get_extra_queryset_fields(self):
+        paginator = getattr(self, 'paginator', None)
+        return getattr(paginator, 'ordering', ())
@@ -0,0 +1,14 @@
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis_client():
+    """
+    Shared Redis connection (the same server Celery uses as a broker)
+    """
+    global _client
+    if _client is None:
+        _client = redis.StrictRedis.from_url(settings.REDIS_URL)
+    return _client
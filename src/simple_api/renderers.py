@@ -0,0 +1,30 @@
+import json
+
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with one shared encoder for the responses made of the JSON
+    types only (e.g. the values() fast path of the list views), the output is
+    the same as of JSONRenderer. Other data and indented output fall back to it.
+    """
+    _encoder = None
+
+    def get_encoder(self):
+        if self._encoder is None:
+            separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+            FastJSONRenderer._encoder = json.JSONEncoder(ensure_ascii=self.ensure_ascii, separators=separators)
+        return self._encoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        try:
+            ret = self.get_encoder().encode(data)
+        except TypeError:
+            # not a JSON type, e.g. Decimal or a lazy translation
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode('utf-8')
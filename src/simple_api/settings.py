@@ -54,6 +54,8 @@ class Base(Configuration):
 
     MIDDLEWARE = [
         'django.middleware.security.SecurityMiddleware',
+        'simple_api.middleware.CompressionMiddleware',
+        'simple_api.middleware.QueryCountMiddleware',
         'whitenoise.middleware.WhiteNoiseMiddleware',
         'django.contrib.sessions.middleware.SessionMiddleware',
         'django.middleware.common.CommonMiddleware',
@@ -98,6 +100,15 @@ class Base(Configuration):
         }
     }
 
+    # per-process by default (tests, local runs), the deployments use Redis:
+    # DJANGO_CACHE_BACKEND=django_redis.cache.RedisCache DJANGO_CACHE_LOCATION=redis://...
+    CACHES = {
+        'default': {
+            'BACKEND': values.Value('django.core.cache.backends.locmem.LocMemCache', environ_name='CACHE_BACKEND'),
+            'LOCATION': values.Value('', environ_name='CACHE_LOCATION'),
+        }
+    }
+
 
     # Password validation
     # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -147,6 +158,10 @@ class Base(Configuration):
         'DEFAULT_AUTHENTICATION_CLASSES': (
             'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
         ),
+        'DEFAULT_RENDERER_CLASSES': (
+            'simple_api.renderers.FastJSONRenderer',
+            'rest_framework.renderers.BrowsableAPIRenderer',
+        ),
     }
 
     ADMIN_EMAIL = 'admin-api@co.com'
@@ -159,6 +174,98 @@ class Base(Configuration):
     CELERY_TASK_SERIALIZER = 'json'
     CELERY_RESULT_SERIALIZER = 'json'
 
+    REDIS_URL = values.Value('redis://localhost:6379')
+
+    # e.g. django.core.mail.backends.console.EmailBackend or .filebased.EmailBackend
+    # with EMAIL_FILE_PATH to measure the email throughput without SendGrid
+    EMAIL_BACKEND = values.Value('django.core.mail.backends.smtp.EmailBackend')
+    EMAIL_FILE_PATH = values.Value(os.path.join(BASE_DIR, '..', 'media', 'emails'))
+    # seconds, of the SMTP connection
+    EMAIL_TIMEOUT = values.IntegerValue(10)
+    # 'sync' - send emails in the request,
+    # 'queue' - enqueue them in Redis and send them in batches with Celery
+    EMAIL_DELIVERY_MODE = values.Value('sync')
+    # seconds
+    EMAIL_QUEUE_FLUSH_INTERVAL = values.IntegerValue(5)
+    # messages per second, 0 - not limited
+    EMAIL_QUEUE_RATE_LIMIT = values.IntegerValue(10)
+    # sending attempts of a message failed with transient errors
+    EMAIL_QUEUE_MAX_ATTEMPTS = values.IntegerValue(5)
+
+    # seconds, of the requests to hunter.io and clearbit.com
+    PROVIDER_CONNECT_TIMEOUT = values.FloatValue(3.05)
+    PROVIDER_READ_TIMEOUT = values.FloatValue(5)
+    # the clearbit.com streaming lookup responds when it is done
+    CLEARBIT_READ_TIMEOUT = values.FloatValue(10)
+    # retries of connection errors and 5xx responses, sleeping backoff * 2 ** retry seconds
+    PROVIDER_RETRIES = values.IntegerValue(2)
+    PROVIDER_RETRY_BACKOFF = values.FloatValue(0.3)
+    # the clearbit.com lookup blocks the registration request, the timed out lookups
+    # are left to the backfill of the additional info
+    CLEARBIT_RETRIES = values.IntegerValue(0)
+    # kept alive connections of a provider per process
+    PROVIDER_POOL_SIZE = values.IntegerValue(10)
+    # failures in a row which open the circuit breaker of a provider, and seconds it stays open
+    PROVIDER_CIRCUIT_FAILURES = values.IntegerValue(5)
+    PROVIDER_CIRCUIT_RESET_TIMEOUT = values.IntegerValue(30)
+
+    # seconds, clearbit.com data is cached by the email and the company data by the domain
+    CLEARBIT_PERSON_CACHE_TIMEOUT = values.IntegerValue(24 * 60 * 60)
+    CLEARBIT_COMPANY_CACHE_TIMEOUT = values.IntegerValue(30 * 24 * 60 * 60)
+    CLEARBIT_NOT_FOUND_CACHE_TIMEOUT = values.IntegerValue(6 * 60 * 60)
+
+    # 'inline' - get the additional info from clearbit.com in the registration,
+    # 'deferred' - fill it later in batches with the backfill_additional_info task
+    ACCOUNTS_ENRICHMENT_MODE = values.Value('inline')
+    # seconds
+    ACCOUNTS_ENRICHMENT_BACKFILL_INTERVAL = values.IntegerValue(300)
+
+    # seconds, hunter.io results are cached by the email in the Django cache
+    HUNTER_CACHE_DELIVERABLE_TIMEOUT = values.IntegerValue(7 * 24 * 60 * 60)
+    HUNTER_CACHE_UNDELIVERABLE_TIMEOUT = values.IntegerValue(24 * 60 * 60)
+    # 'risky', 'unknown' and other results
+    HUNTER_CACHE_UNKNOWN_TIMEOUT = values.IntegerValue(60 * 60)
+    # items and seconds of the in-process cache in front of the Django cache, 0 disables it
+    HUNTER_LOCAL_CACHE_SIZE = values.IntegerValue(1000)
+    HUNTER_LOCAL_CACHE_TIMEOUT = values.IntegerValue(60)
+    # seconds, the hits and misses are counted in the process and added to the Django cache
+    HUNTER_STATS_FLUSH_INTERVAL = values.IntegerValue(10)
+
+    # 'sync' - check the email, get the additional info and send the activation email
+    # in the registration request, 'async' - create the user as pending and do it with Celery
+    ACCOUNTS_REGISTRATION_MODE = values.Value('sync')
+
+    # 'db' - update posts_post on every like,
+    # 'redis' - buffer like deltas in Redis and flush them periodically
+    POSTS_LIKES_COUNTER = values.Value('db')
+    # seconds
+    POSTS_LIKES_FLUSH_INTERVAL = values.IntegerValue(10)
+
+    # seconds
+    POSTS_TRENDING_REFRESH_INTERVAL = values.IntegerValue(300)
+
+    # 'sync' - delete a post with its likes in the request,
+    # 'async' - hide the post and delete it with Celery
+    POSTS_DELETE_MODE = values.Value('sync')
+
+    # max number of posts in one bulk create request
+    POSTS_BULK_CREATE_MAX_SIZE = values.IntegerValue(500)
+
+    # max number of ids in one multi-get request
+    POSTS_MULTI_GET_MAX_SIZE = values.IntegerValue(100)
+
+    # seconds, 0 disables the cache of post list and detail responses
+    POSTS_RESPONSE_CACHE_TIMEOUT = values.IntegerValue(60)
+
+    # False leaves the compression to nginx (gzip only)
+    RESPONSE_COMPRESSION = values.BooleanValue(True)
+    # bytes, shorter responses are sent as is
+    RESPONSE_COMPRESSION_MIN_LENGTH = values.IntegerValue(1024)
+    # 1-9
+    RESPONSE_COMPRESSION_GZIP_LEVEL = values.IntegerValue(6)
+    # 0-11, used when the brotli package is installed
+    RESPONSE_COMPRESSION_BROTLI_QUALITY = values.IntegerValue(4)
+
 
 class Dev(Base):
     DEBUG = True
@@ -188,4 +295,11 @@ class Prod(Base):
     STATIC_ROOT = os.path.join(Base.BASE_DIR, 'staticfiles')
     DATABASES = Base.DATABASES.copy()
     DATABASES['default'] = dj_database_url.config(conn_max_age=600, ssl_require=True)
+    # the cached responses are shared by all the workers
+    CACHES = {
+        'default': {
+            'BACKEND': values.Value('django_redis.cache.RedisCache', environ_name='CACHE_BACKEND'),
+            'LOCATION': values.Value('redis://localhost:6379/1', environ_name='CACHE_LOCATION'),
+        }
+    }
 
@@ -0,0 +1,88 @@
+"""
+Compound documents: ?include=user adds the related objects of a page to the
+"included" block of the response, each of them once, with one query per name.
+"""
+from collections import OrderedDict
+
+from rest_framework.exceptions import ValidationError
+
+from .query_plans import plan_queryset
+from .sparse_fieldsets import get_requested_fields
+from .values_serialization import compile_row_serializer
+
+
+class SideLoadMixin(object):
+    """
+    Side-load the objects referenced by the items of a paginated list view.
+    side_loads = {name: (item key with the related id, serializer class)},
+    the item key is a serializer field, it is added to the sparse fields
+    of the request for the side-loading and removed from the items after it
+    """
+    include_query_param = 'include'
+    side_loads = {}
+
+    def get_includes(self):
+        value = self.request.query_params.get(self.include_query_param)
+        if not value:
+            return []
+        names = list(OrderedDict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.side_loads]
+        if unknown:
+            raise ValidationError({self.include_query_param: 'Unknown includes: %s' % ', '.join(unknown)})
+        return names
+
+    def get_requested_fields(self):
+        """
+        Return the sparse fields of the request, None if all the fields are shown
+        """
+        fields_query_param = getattr(self.get_serializer_class(), 'fields_query_param', None)
+        if fields_query_param is None:
+            return None
+        return get_requested_fields(self.request, fields_query_param)
+
+    def get_hidden_side_load_keys(self):
+        """
+        Return the keys of the includes which are not in the requested sparse fields
+        """
+        fields = self.get_requested_fields()
+        if fields is None:
+            return []
+        keys = OrderedDict.fromkeys(self.side_loads[name][0] for name in self.get_includes())
+        return [key for key in keys if key not in fields]
+
+    def get_serializer(self, *args, **kwargs):
+        hidden_keys = self.get_hidden_side_load_keys()
+        if hidden_keys and 'fields' not in kwargs:
+            kwargs['fields'] = self.get_requested_fields() + hidden_keys
+        return super(SideLoadMixin, self).get_serializer(*args, **kwargs)
+
+    def get_paginated_response(self, data):
+        includes = self.get_includes()
+        if includes:
+            included = OrderedDict((name, self.side_load(name, data)) for name in includes)
+            hidden_keys = self.get_hidden_side_load_keys()
+            for item in data:
+                for key in hidden_keys:
+                    item.pop(key, None)
+        response = super(SideLoadMixin, self).get_paginated_response(data)
+        if includes:
+            response.data['included'] = included
+        return response
+
+    def side_load(self, name, data):
+        """
+        Return the serialized objects referenced by the items in the order of the first reference
+        """
+        key, serializer_class = self.side_loads[name]
+        ids = list(OrderedDict.fromkeys(item[key] for item in data if item.get(key) is not None))
+        if not ids:
+            return []
+        serializer = serializer_class(many=True)
+        queryset = serializer.child.Meta.model._default_manager.filter(pk__in=ids)
+        row_serializer = compile_row_serializer(serializer)
+        if row_serializer is not None:
+            pk_path = row_serializer.paths[0]
+            rows = {row[pk_path]: row for row in queryset.values(*row_serializer.paths)}
+            return [row_serializer.to_representation(rows[pk]) for pk in ids if pk in rows]
+        objects = plan_queryset(queryset, serializer).in_bulk(ids)
+        return serializer_class([objects[pk] for pk in ids if pk in objects], many=True).data
@@ -0,0 +1,53 @@
+"""
+Sparse fieldsets: ?fields=id,title keeps only the listed fields of a serializer.
+The querysets planned from the serializer (simple_api.query_plans) load only
+the columns of the kept fields.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+def get_requested_fields(request, fields_query_param='fields'):
+    """
+    Return the names of the comma separated fields param of the request,
+    None if it is not given
+    """
+    params = getattr(request, 'query_params', request.GET)
+    value = params.get(fields_query_param)
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsetMixin(object):
+    """
+    Keep only the fields given by the fields kwarg or by the comma separated
+    ?fields= param of the request in the serializer context.
+    computed_fields - names added to the output outside of the serializer fields,
+    the requested names are kept in sparse_fieldset (None if all the fields are shown)
+    """
+    fields_query_param = 'fields'
+    computed_fields = ()
+    sparse_fieldset = None
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super(SparseFieldsetMixin, self).__init__(*args, **kwargs)
+        if fields is None:
+            fields = self.get_requested_fields()
+        if fields is not None:
+            self.apply_sparse_fieldset(fields)
+
+    def get_requested_fields(self):
+        request = self.context.get('request')
+        if request is None:
+            return None
+        return get_requested_fields(request, self.fields_query_param)
+
+    def apply_sparse_fieldset(self, fields):
+        unknown = set(fields) - set(self.fields) - set(self.computed_fields)
+        if unknown:
+            raise ValidationError({self.fields_query_param: 'Unknown fields: %s' % ', '.join(sorted(unknown))})
+        for field_name in list(self.fields):
+            if field_name not in fields:
+                self.fields.pop(field_name)
+        self.sparse_fieldset = fields
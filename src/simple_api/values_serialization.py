@@ -0,0 +1,124 @@
+"""
+Read-only fast path of the list views: the rows are fetched with .values() and
+rendered by accessors compiled from the serializer fields, which produces the
+same data as the serializer without creating model instances and walking the
+DRF field machinery for every object.
+"""
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.serializers import (
+    BaseSerializer,
+    ListSerializer,
+    ReadOnlyField,
+    SerializerMethodField
+)
+
+
+class RowSerializer(object):
+    """
+    Serializer of .values() rows, built by compile_row_serializer()
+    """
+    def __init__(self, paths, accessors):
+        self.paths = paths
+        # [(field name, path, to_representation or None)]
+        # or [(field name, nested RowSerializer, None)]
+        self.accessors = accessors
+
+    def to_representation(self, row):
+        # a nested object is None if its primary key is None
+        if row[self.paths[0]] is None:
+            return None
+        ret = OrderedDict()
+        for field_name, path, to_representation in self.accessors:
+            if isinstance(path, RowSerializer):
+                ret[field_name] = path.to_representation(row)
+                continue
+            value = row[path]
+            if value is None or to_representation is None:
+                ret[field_name] = value
+            else:
+                ret[field_name] = to_representation(value)
+        return ret
+
+
+def compile_row_serializer(serializer, model=None, prefix=''):
+    """
+    Return RowSerializer for the serializer (a ListSerializer or a single serializer),
+    None if some field needs a model instance (SerializerMethodField, nested lists,
+    properties, dotted sources)
+    """
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    model = model or serializer.Meta.model
+    pk_path = prefix + model._meta.pk.attname
+    paths, accessors = [pk_path], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, (ListSerializer, SerializerMethodField)) or field.source == '*':
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        path = prefix + field.source
+        if field.source == model_field.attname and model_field.concrete:
+            # a column, including the foreign key id of e.g. source='user_id'
+            paths.append(path)
+            to_representation = None if isinstance(field, ReadOnlyField) else field.to_representation
+            accessors.append((field.field_name, path, to_representation))
+        elif isinstance(field, BaseSerializer):
+            if not (model_field.many_to_one or model_field.one_to_one):
+                return None
+            nested = compile_row_serializer(field, model_field.related_model, path + '__')
+            if nested is None:
+                return None
+            paths.extend(nested.paths)
+            accessors.append((field.field_name, nested, None))
+        elif model_field.is_relation:
+            if not (isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None and
+                    model_field.many_to_one):
+                return None
+            path = prefix + model_field.attname
+            paths.append(path)
+            accessors.append((field.field_name, path, None))
+        else:
+            return None
+    return RowSerializer(list(OrderedDict.fromkeys(paths)), accessors)
+
+
+class ValuesListMixin(object):
+    """
+    Render the list of a ListAPIView from .values() rows when its serializer
+    can be compiled. The list serializer may post-process the rendered data
+    with to_representation_values(data), the items have the pk key there
+    even if it is not one of the (sparse) fields.
+    """
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(many=True)
+        row_serializer = compile_row_serializer(serializer)
+        if row_serializer is None:
+            return super(ValuesListMixin, self).list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = getattr(self.paginator, 'ordering', ())
+        extra_paths = [field for field in ordering if field not in row_serializer.paths]
+        queryset = queryset.prefetch_related(None).values(*(row_serializer.paths + extra_paths))
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+        data = [row_serializer.to_representation(row) for row in rows]
+        if hasattr(serializer, 'to_representation_values'):
+            pk_path = row_serializer.paths[0]
+            pk_rendered = pk_path in [field_name for field_name, _, _ in row_serializer.accessors]
+            if not pk_rendered:
+                for item, row in zip(data, rows):
+                    item[pk_path] = row[pk_path]
+            data = serializer.to_representation_values(data)
+            if not pk_rendered:
+                for item in data:
+                    del item[pk_path]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)